@@ -76,9 +76,12 @@ def commands():
     global this
     global request
     global expandvars
+    global alias
 
     env.PYTHONPATH.append("{root}/resources/python")
 
+    alias("tz_db", "python {root}/resources/python/db_tools.py")
+
     environ = this._environ
     result = list(environ["any"].items())
     # Add request-specific environments
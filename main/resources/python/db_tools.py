@@ -0,0 +1,166 @@
+"""
+Maintenance commands for the rendering database.
+
+    python db_tools.py backfill-shot-info
+    python db_tools.py ensure-indexes
+    python db_tools.py explain
+    python db_tools.py load-report --episode ep_101
+    python db_tools.py render-history --episode ep_101
+    python db_tools.py validate-files --episode ep_101
+"""
+import os
+import sys
+import argparse
+import datetime
+import collections
+
+import file_checks
+from mongo_documents import MayaJob, NukeJob, RenderStat, DatabaseConnection, adaptive_chunk_size
+
+DB_NAME = "rendering"
+DBHOST = os.getenv("DB_HOST", "192.168.99.2")
+DBPORT = 27017
+
+INDEXED_DOCUMENTS = (MayaJob, NukeJob, RenderStat)
+
+# The queries the tools run in production, checked by the explain command.
+QUERIES = [
+    ("submitter search", lambda: MayaJob.objects(
+        batch_name__icontains="sc_", status__exact="new").order_by("batch_name")),
+    ("submitter list", lambda: MayaJob.objects().order_by("batch_name")),
+    ("render setup scene lookup", lambda: MayaJob.objects(scene_file="")),
+    ("maya jobs by episode", lambda: MayaJob.objects(season="", episode_name="")),
+    ("deadline sync jobs", lambda: MayaJob.on_farm()),
+    ("maya jobs updated since", lambda: MayaJob.objects(
+        date_updated__gte=datetime.datetime.utcnow())),
+    ("render stat of a layer", lambda: RenderStat.objects(
+        layer_name="", episode_name="").order_by("-date_created")),
+    ("nuke job by shot number", lambda: NukeJob.by_shotnum(0)),
+    ("nuke scene lookup", lambda: NukeJob.objects(scene_file="")),
+    ("nuke jobs by episode", lambda: NukeJob.objects(season="", episode="")),
+]
+
+
+def plan_stages(plan):
+    """Yield every stage name of an explain() query plan."""
+    yield plan.get("stage")
+    children = plan.get("inputStages", [])
+    if "inputStage" in plan:
+        children = children + [plan["inputStage"]]
+    for child in children:
+        for stage in plan_stages(child):
+            yield stage
+
+
+def backfill_shot_info(args):
+    updated = NukeJob.backfill_shot_info()
+    print("Stored shot info on {} nuke jobs.".format(updated))
+
+
+def ensure_indexes(args):
+    for document in INDEXED_DOCUMENTS:
+        document.ensure_indexes()
+        collection = document._get_collection()
+        print("{}: {}".format(
+            collection.name, ", ".join(sorted(collection.index_information()))))
+
+
+def explain(args):
+    scans = 0
+    for name, query in QUERIES:
+        plan = query().explain()["queryPlanner"]["winningPlan"]
+        # slot based engine nests the classic plan
+        plan = plan.get("queryPlan", plan)
+        stages = [s for s in plan_stages(plan) if s]
+        if "COLLSCAN" in stages:
+            scans += 1
+        print("{:<30} {:<10} {}".format(
+            name, "COLLSCAN" if "COLLSCAN" in stages else "ok", " <- ".join(stages)))
+    return 1 if scans else 0
+
+
+def load_report(args):
+    """Scene load time spent on the farm per layer and what adaptive chunks save."""
+    stats = RenderStat.objects()
+    if args.episode:
+        stats = stats(episode_name=args.episode)
+
+    layers = collections.defaultdict(lambda: [0, 0, 0.0, 0.0])
+    for stat in stats.only("layer_name", "frame_count", "task_count", "frame_time", "load_time"):
+        chunk_size = adaptive_chunk_size(stat.frame_time, stat.load_time, stat.frame_count)
+        adaptive_tasks = -(-stat.frame_count // chunk_size)
+        totals = layers[stat.layer_name]
+        totals[0] += stat.frame_count
+        totals[1] += stat.task_count
+        totals[2] += stat.load_overhead
+        totals[3] += adaptive_tasks * (stat.load_time or 0)
+
+    print("{:<24} {:>8} {:>8} {:>12} {:>12} {:>12}".format(
+        "layer", "frames", "tasks", "load h", "adaptive h", "saved h"))
+    spent = saved = 0.0
+    for layer_name, (frames, tasks, load, adaptive) in sorted(layers.items()):
+        spent += load
+        saved += load - adaptive
+        print("{:<24} {:>8} {:>8} {:>12.2f} {:>12.2f} {:>12.2f}".format(
+            layer_name, frames, tasks, load / 3600, adaptive / 3600, (load - adaptive) / 3600))
+    print("Scene loading took {:.1f} h, adaptive chunks save {:.1f} h".format(
+        spent / 3600, saved / 3600))
+
+
+def render_history(args):
+    """Per episode and per layer render time estimates from RenderStat."""
+    print("{:<24} {:>6} {:>8} {:>10} {:>10}".format("episode", "jobs", "frames", "s/frame", "hours"))
+    for episode, row in sorted(RenderStat.episode_summary().items(), key=lambda r: str(r[0])):
+        if args.episode and episode != args.episode:
+            continue
+        print("{:<24} {jobs:>6} {frames:>8} {frame_time:>10.1f} {render_hours:>10.1f}".format(
+            str(episode), **dict(row, frame_time=row["frame_time"] or 0)))
+
+    print("")
+    print("{:<24} {:>6} {:>8} {:>10} {:>10} {:>10}".format(
+        "layer", "jobs", "frames", "s/frame", "load s", "peak GB"))
+    for layer_name, row in sorted(RenderStat.layer_summary(args.episode).items()):
+        print("{:<24} {:>6} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+            layer_name, row["jobs"], row["frames"], row["frame_time"] or 0,
+            row["load_time"] or 0, (row["peak_ram"] or 0) / 1024.0 ** 3))
+
+
+def validate_files(args):
+    """Jobs whose scene file is missing, the files are stat-ed in parallel."""
+    invalid = 0
+    for document, episode_field in ((MayaJob, "episode_name"), (NukeJob, "episode")):
+        jobs = document.objects()
+        if args.episode:
+            jobs = jobs(**{episode_field: args.episode})
+        errors = file_checks.validate_many(jobs)
+        for job, error in sorted(errors.items(), key=lambda e: e[0].scene_file or ""):
+            print("{:<10} {}: {}".format(document.__name__, job.scene_file, error))
+        invalid += len(errors)
+    print("{} invalid jobs".format(invalid))
+    return 1 if invalid else 0
+
+
+COMMANDS = {
+    "backfill-shot-info": backfill_shot_info,
+    "ensure-indexes": ensure_indexes,
+    "explain": explain,
+    "load-report": load_report,
+    "render-history": render_history,
+    "validate-files": validate_files,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--host", default=DBHOST)
+    parser.add_argument("--port", type=int, default=DBPORT)
+    parser.add_argument("--episode", help="reports of one episode only")
+    args = parser.parse_args(argv)
+
+    with DatabaseConnection(DB_NAME, args.host, args.port):
+        return COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Shared, lazily connected Deadline client.
+
+    from deadline_client import deadline
+    deadline.Jobs.SubmitJob(job_info, plugin_info)
+
+The DeadlineCon is only built on first use, so importing a tool doesn't
+touch the farm. Group names are kept in a small json file next to the
+other caches, callers fetch them again once they are older than
+DEADLINE_GROUPS_TTL seconds.
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+
+PULSE_NAME = os.getenv("DEADLINE_PULSE", "dell")
+DEADLINE_PORT = int(os.getenv("DEADLINE_PORT", 8082))
+DEADLINE_LOGIN = "admin"
+DEADLINE_PASSWORD = "123"
+
+GROUPS_CACHE = os.getenv(
+    "DEADLINE_GROUPS_CACHE", os.path.join(tempfile.gettempdir(), "deadline_groups.json"))
+GROUPS_TTL = float(os.getenv("DEADLINE_GROUPS_TTL", 3600))
+
+
+class DeadlineClient(object):
+
+    def __init__(self, host=PULSE_NAME, port=DEADLINE_PORT,
+                 login=DEADLINE_LOGIN, password=DEADLINE_PASSWORD,
+                 groups_cache=GROUPS_CACHE, groups_ttl=GROUPS_TTL):
+        self.host = host
+        self.port = port
+        self.login = login
+        self.password = password
+        self.groups_cache = groups_cache
+        self.groups_ttl = groups_ttl
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        with self._lock:
+            if self._connection is None:
+                from Deadline.DeadlineConnect import DeadlineCon
+
+                connection = DeadlineCon(self.host, self.port)
+                connection.SetAuthenticationCredentials(self.login, self.password)
+                self._connection = connection
+            return self._connection
+
+    def __getattr__(self, name):
+        # Jobs, Groups, Tasks... straight from the DeadlineCon
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.connection, name)
+
+    def cached_group_names(self):
+        """
+        Return (groups, fresh) from the on-disk cache without asking the farm.
+        groups is empty when there is no cache yet.
+        """
+        try:
+            with open(self.groups_cache) as f:
+                cached = json.load(f)
+            groups = list(cached["groups"])
+            age = time.time() - cached["time"]
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return [], False
+        return groups, 0 <= age < self.groups_ttl
+
+    def fetch_group_names(self):
+        """
+        Ask the farm for the group names and store them in the cache. Raises
+        IOError when the cache can't be written.
+        """
+        groups = list(self.Groups.GetGroupNames())
+        temp_path = self.groups_cache + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump({"time": time.time(), "groups": groups}, f)
+            if os.path.exists(self.groups_cache):
+                os.remove(self.groups_cache)
+            os.rename(temp_path, self.groups_cache)
+        except (IOError, OSError) as e:
+            raise IOError("Can't write deadline groups cache {}: {}".format(self.groups_cache, e))
+        return groups
+
+
+deadline = DeadlineClient()
@@ -0,0 +1,79 @@
+"""
+File existence checks for document validation.
+
+Results of os.path.isfile are cached for a short time, so saving a batch of
+jobs does not pay an SMB round trip per document.
+"""
+import os
+import threading
+import timeit
+from multiprocessing.pool import ThreadPool
+
+from mongoengine.errors import ValidationError
+
+STAT_TTL = float(os.getenv("FILE_CHECK_TTL", 10))
+WORKERS = int(os.getenv("FILE_CHECK_WORKERS", 8))
+
+
+class StatCache(object):
+
+    def __init__(self, ttl=STAT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._results = {}
+
+    def isfile(self, filename):
+        now = timeit.default_timer()
+        with self._lock:
+            cached = self._results.get(filename)
+        if cached and now - cached[0] < self.ttl:
+            return cached[1]
+
+        exists = os.path.isfile(filename)
+        with self._lock:
+            self._results[filename] = (now, exists)
+        return exists
+
+    def prefetch(self, filenames, workers=WORKERS):
+        """Stat many files in parallel threads and cache the results."""
+        filenames = list(set(filenames))
+        if not filenames:
+            return {}
+        pool = ThreadPool(min(workers, len(filenames)))
+        try:
+            return dict(zip(filenames, pool.map(self.isfile, filenames)))
+        finally:
+            pool.close()
+
+    def invalidate(self, filename=None):
+        with self._lock:
+            if filename is None:
+                self._results.clear()
+            else:
+                self._results.pop(filename, None)
+
+
+stat_cache = StatCache()
+
+
+def check_file(filename):
+    if not stat_cache.isfile(filename):
+        raise ValidationError("File does not exists")
+
+
+def validate_many(documents, field="scene_file", workers=WORKERS):
+    """
+    Validate documents with their file fields stat-ed in parallel first.
+    Returns a dict of document to ValidationError for the invalid ones.
+    """
+    documents = list(documents)
+    stat_cache.prefetch(
+        [getattr(d, field) for d in documents if getattr(d, field, None)], workers)
+
+    errors = {}
+    for document in documents:
+        try:
+            document.validate()
+        except ValidationError as e:
+            errors[document] = e
+    return errors
@@ -0,0 +1,303 @@
+"""
+Compact frame range type.
+
+A FrameSet keeps frames as sorted, disjoint (first, last, step) runs, so a
+10k frame range costs one tuple instead of a 10k item list or string.
+
+    >>> fs = FrameSet.parse("101-120, 121, 140-200x10")
+    >>> fs.to_deadline()
+    '101-121,140-200x10'
+    >>> FrameSet.parse("1-100").to_deadline(qc=True)
+    '1,100,65,33-97x64,17-81x32,9-89x16,5-93x8,3-99x4,2-98x2'
+"""
+import re
+import bisect
+import collections
+
+_TOKEN = re.compile(r"^(-?\d+)(?:-(-?\d+)(?:(?:x|step|by)(\d+))?)?$")
+
+
+def _reorder(seq):
+    '''Yield items from seq reordered to http://stackoverflow.com/q/33372753/
+    seq can be any sequence, eg. a list or a Python 3 range object.
+    '''
+    # output first and last element before all the middles
+    if seq:
+        yield seq[0]
+    if len(seq) > 1:
+        yield seq[-1]
+
+    # a queue of range indices (start, stop)
+    queue = collections.deque([(1, len(seq)-1)])
+    while queue:
+        start, stop = queue.popleft()
+        if start < stop:
+            middle = (start + stop) // 2
+            yield seq[middle]
+            queue.append((start, middle))
+            queue.append((middle+1, stop))
+
+
+def _run_length(run):
+    first, last, step = run
+    return (last - first) // step + 1
+
+
+def _compress(frames):
+    """Turn sorted unique frames into (first, last, step) runs."""
+    runs = []
+    i = 0
+    count = len(frames)
+    while i < count:
+        first = frames[i]
+        if i + 1 == count:
+            runs.append((first, first, 1))
+            break
+        step = frames[i + 1] - first
+        j = i + 1
+        while j + 1 < count and frames[j + 1] - frames[j] == step:
+            j += 1
+        # two frames far apart read better as two single frames
+        if step != 1 and j == i + 1:
+            runs.append((first, first, 1))
+            i += 1
+            continue
+        runs.append((first, frames[j], step))
+        i = j + 1
+    return runs
+
+
+def _normalize(runs):
+    runs = sorted((min(f, l), max(f, l), max(int(s), 1)) for f, l, s in runs)
+    runs = [(f, f + (l - f) // s * s, s) for f, l, s in runs]
+    runs = [(f, l, s if f != l else 1) for f, l, s in runs]
+
+    merged = []
+    for run in runs:
+        if not merged or run[0] > merged[-1][1]:
+            merged.append(run)
+        elif run[2] == 1 and merged[-1][2] == 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], run[1]), 1)
+        else:
+            # overlapping stepped runs, fall back to exact frames
+            frames = set()
+            for f, l, s in runs:
+                frames.update(range(f, l + 1, s))
+            return _compress(sorted(frames))
+
+    # join touching unit runs, 1-10 and 11-20 become 1-20
+    joined = []
+    for run in merged:
+        if joined and joined[-1][2] == 1 and run[2] == 1 and run[0] == joined[-1][1] + 1:
+            joined[-1] = (joined[-1][0], run[1], 1)
+        else:
+            joined.append(run)
+    return joined
+
+
+class FrameSet(object):
+    __slots__ = ("_runs", "_offsets")
+
+    def __init__(self, runs=()):
+        self._runs = tuple(_normalize(runs))
+        self._offsets = []
+        total = 0
+        for run in self._runs:
+            self._offsets.append(total)
+            total += _run_length(run)
+        self._offsets.append(total)
+
+    @classmethod
+    def parse(cls, frames_string):
+        """Parse Deadline style frame lists: 1-100, 1-100x5, 7, -3--1"""
+        runs = []
+        for token in str(frames_string).replace(" ", "").split(","):
+            if not token:
+                continue
+            match = _TOKEN.match(token)
+            if not match:
+                raise ValueError("Invalid frame range: {}".format(token))
+            first, last, step = match.groups()
+            first = int(first)
+            last = int(last) if last is not None else first
+            runs.append((first, last, int(step or 1)))
+        return cls(runs)
+
+    @classmethod
+    def from_frames(cls, frames):
+        return cls(_compress(sorted(set(int(f) for f in frames))))
+
+    @classmethod
+    def from_range(cls, first, last, step=1):
+        return cls([(first, last, step)])
+
+    @property
+    def runs(self):
+        return self._runs
+
+    @property
+    def first(self):
+        return self._runs[0][0] if self._runs else None
+
+    @property
+    def last(self):
+        return self._runs[-1][1] if self._runs else None
+
+    def __len__(self):
+        return self._offsets[-1]
+
+    def __bool__(self):
+        return bool(self._runs)
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        for first, last, step in self._runs:
+            for frame in range(first, last + 1, step):
+                yield frame
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("FrameSet index out of range")
+        run_index = bisect.bisect_right(self._offsets, index) - 1
+        first, _, step = self._runs[run_index]
+        return first + (index - self._offsets[run_index]) * step
+
+    def __contains__(self, frame):
+        for first, last, step in self._runs:
+            if first <= frame <= last:
+                return (frame - first) % step == 0
+        return False
+
+    def __eq__(self, other):
+        return isinstance(other, FrameSet) and self._runs == other._runs
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._runs)
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def __repr__(self):
+        return "FrameSet({!r})".format(self.to_deadline())
+
+    def __str__(self):
+        return self.to_deadline()
+
+    def union(self, *others):
+        runs = list(self._runs)
+        for other in others:
+            runs.extend(other.runs)
+        return FrameSet(runs)
+
+    def intersection(self, other):
+        if all(s == 1 for _, _, s in self._runs + other.runs):
+            runs = []
+            for first, last, _ in self._runs:
+                for o_first, o_last, _ in other.runs:
+                    if o_first <= last and first <= o_last:
+                        runs.append((max(first, o_first), min(last, o_last), 1))
+            return FrameSet(runs)
+        return FrameSet.from_frames(f for f in self if f in other)
+
+    def difference(self, other):
+        return FrameSet.from_frames(f for f in self if f not in other)
+
+    def chunks(self, size):
+        """Yield consecutive FrameSets of at most size frames."""
+        size = max(int(size), 1)
+        for start in range(0, len(self), size):
+            yield self.slice(start, start + size)
+
+    def slice(self, start, stop):
+        """FrameSet of the frames with index in [start, stop)."""
+        stop = min(stop, len(self))
+        runs = []
+        for run, offset in zip(self._runs, self._offsets):
+            first, _, step = run
+            lo = max(start, offset) - offset
+            hi = min(stop, offset + _run_length(run)) - offset
+            if lo < hi:
+                runs.append((first + lo * step, first + (hi - 1) * step, step))
+        return FrameSet(runs)
+
+    def qc_order(self):
+        """Iterate frames first, last, then bisecting midpoints."""
+        return _reorder(self)
+
+    def _qc_passes(self):
+        """
+        Split every run into coarse to fine strided runs: ends first, then
+        frames at stride 2**k, 2**(k-1) ... 1, each pass a single run.
+        """
+        ends = []
+        passes = collections.defaultdict(list)
+        for run in self._runs:
+            first, last, step = run
+            count = _run_length(run)
+            ends.append((first, first, 1))
+            if count > 1:
+                ends.append((last, last, 1))
+            stride = 1
+            while stride * 2 < count - 1:
+                stride *= 2
+            while stride >= 1:
+                # odd multiples of stride, between the two ends
+                top = (count - 2) // stride
+                if top % 2 == 0:
+                    top -= 1
+                if top >= 1:
+                    passes[stride].append(
+                        (first + stride * step, first + top * stride * step, stride * 2 * step))
+                stride //= 2
+        return [ends] + [passes[s] for s in sorted(passes, reverse=True)]
+
+    def to_deadline(self, qc=False):
+        """
+        Serialize to Deadline frame list syntax. With qc the frames are
+        ordered for QC, ends first then ever finer strides, using a few
+        tokens per run instead of one token per frame.
+        """
+        if qc:
+            runs = [run for level in self._qc_passes() for run in level]
+        else:
+            runs = self._runs
+        return ",".join(_format_run(*run) for run in runs)
+
+
+def listed_in_order(frames_string):
+    """
+    True if a Deadline frame list names its frames in ascending order.
+    Deadline renders and chunks a list as written, a QC ordered list
+    like 1,100,50 is not in order.
+    """
+    last = None
+    for token in str(frames_string).replace(" ", "").split(","):
+        if not token:
+            continue
+        run = FrameSet.parse(token)
+        if last is not None and run.first <= last:
+            return False
+        last = run.last
+    return True
+
+
+def _format_run(first, last, step):
+    if first == last:
+        return str(first)
+    if step == 1:
+        return "{}-{}".format(first, last)
+    return "{}-{}x{}".format(first, last, step)
@@ -0,0 +1,127 @@
+import os
+import atexit
+import threading
+import timeit
+
+import mongoengine
+from mongoengine.connection import DEFAULT_CONNECTION_NAME
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+POOL_OPTIONS = {
+    "maxPoolSize": _env_int("DB_MAX_POOL_SIZE", 20),
+    "minPoolSize": _env_int("DB_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": _env_int("DB_MAX_IDLE_TIME_MS", 300000),
+    "connectTimeoutMS": _env_int("DB_CONNECT_TIMEOUT_MS", 5000),
+    "serverSelectionTimeoutMS": _env_int("DB_SERVER_SELECTION_TIMEOUT_MS", 5000),
+}
+
+HEALTH_CHECK_INTERVAL = _env_int("DB_HEALTH_CHECK_INTERVAL", 30)
+
+
+class _PooledConnection(object):
+
+    def __init__(self, db_name, host, port, alias, options):
+        self.db_name = db_name
+        self.host = host
+        self.port = port
+        self.alias = alias
+        self.options = options
+        self.last_check = timeit.default_timer()
+        self.client = mongoengine.connect(
+            db_name, alias=alias, host=host, port=port, **options)
+
+    def matches(self, db_name, host, port):
+        return (self.db_name, self.host, self.port) == (db_name, host, port)
+
+    def ping(self):
+        try:
+            self.client.admin.command("ping")
+        except Exception:
+            return False
+        self.last_check = timeit.default_timer()
+        return True
+
+    def close(self):
+        mongoengine.connection.disconnect(alias=self.alias)
+
+
+class ConnectionRegistry(object):
+    """
+    Process wide registry of long-lived mongoengine connections.
+
+    Every alias is connected once, backed by the MongoClient connection pool,
+    and reused by all later DatabaseConnection blocks. Connections are pinged
+    when they were idle for longer than health_check_interval seconds, and
+    reconnected if the server does not answer.
+    """
+
+    def __init__(self, options=None, health_check_interval=HEALTH_CHECK_INTERVAL):
+        self._lock = threading.RLock()
+        self._connections = {}
+        self.options = dict(POOL_OPTIONS)
+        if options:
+            self.options.update(options)
+        self.health_check_interval = health_check_interval
+
+    def configure(self, health_check_interval=None, **options):
+        """
+        Change pool limits. Applies to connections opened after the call,
+        use reset() to reopen the already registered ones.
+        """
+        with self._lock:
+            self.options.update(options)
+            if health_check_interval is not None:
+                self.health_check_interval = health_check_interval
+
+    def connect(self, db_name, host="localhost", port=27017, alias=DEFAULT_CONNECTION_NAME):
+        with self._lock:
+            conn = self._connections.get(alias)
+            if conn and not conn.matches(db_name, host, port):
+                self.disconnect(alias)
+                conn = None
+
+            if conn and self._is_stale(conn) and not conn.ping():
+                self.disconnect(alias)
+                conn = None
+
+            if not conn:
+                conn = _PooledConnection(
+                    db_name, host, port, alias, dict(self.options))
+                self._connections[alias] = conn
+
+            return conn.client
+
+    def check(self, alias=DEFAULT_CONNECTION_NAME):
+        """Ping the connection registered under alias, return True if it is healthy."""
+        with self._lock:
+            conn = self._connections.get(alias)
+            return bool(conn and conn.ping())
+
+    def disconnect(self, alias=DEFAULT_CONNECTION_NAME):
+        with self._lock:
+            conn = self._connections.pop(alias, None)
+            if conn:
+                conn.close()
+
+    def reset(self):
+        with self._lock:
+            for alias in list(self._connections):
+                self.disconnect(alias)
+
+    def aliases(self):
+        with self._lock:
+            return list(self._connections)
+
+    def _is_stale(self, conn):
+        return timeit.default_timer() - conn.last_check > self.health_check_interval
+
+
+registry = ConnectionRegistry()
+atexit.register(registry.reset)
@@ -1,54 +1,98 @@
 import os
+import uuid
 import datetime
-import collections
 import mongoengine
-from mongoengine.errors import ValidationError
+from mongoengine.queryset import QuerySet
+from mongoengine.queryset.visitor import Q
+from pymongo import UpdateOne
 from mongoengine.queryset.manager import queryset_manager
 
+import file_checks
+from frame_set import FrameSet
+from mongo_connection import registry
+
 
 PROJECT_ROOT = os.getenv("PROJECT_ROOT", "Z:\\Projects\\Turbosaurs")
 
+# seconds one Deadline task should take, scene load included
+CHUNK_TARGET_SECONDS = float(os.getenv("CHUNK_TARGET_SECONDS", 600))
+MAX_CHUNK_SIZE = int(os.getenv("MAX_CHUNK_SIZE", 20))
 
-def _file_exists(filename):
-    if not os.path.isfile(filename):
-        raise ValidationError("File does not exists")
+# Deadline task Stat of a completed task
+TASK_COMPLETED = 5
 
+# daily_status values deadline_sync no longer has to look at
+FINAL_DAILY_STATUSES = ["done", "deleted"]
 
-def _file_exists_relative(filename):
-    _file_exists(os.path.join(PROJECT_ROOT, filename))
 
+def _file_exists(filename):
+    file_checks.check_file(filename)
 
-def _reorder(seq):
-    '''Yield items from seq reordered to http://stackoverflow.com/q/33372753/
-    seq can be any sequence, eg. a list or a Python 3 range object.
-    '''
-    # output first and last element before all the middles
-    if seq:
-        yield seq[0]
-    if len(seq) > 1:
-        yield seq[-1]
 
-    # a queue of range indices (start, stop)
-    queue = collections.deque([(1, len(seq)-1)])
-    while queue:
-        start, stop = queue.popleft()
-        if start < stop:
-            middle = (start + stop) // 2
-            yield seq[middle]
-            queue.append((start, middle))
-            queue.append((middle+1, stop))
+def _file_exists_relative(filename):
+    _file_exists(os.path.join(PROJECT_ROOT, filename))
 
 
 def frame_list(frames_string):
-    frames_string = frames_string.replace(" ", "").split(",")
-    flist = []
-    for f in frames_string:
-        if "-" in f:
-            fr = [int(n) for n in f.split("-")]
-            flist += [str(i) for i in (_reorder(range(fr[0], fr[1]+1)))]
-        else:
-            flist.append(f)
-    return ", ".join(flist)
+    """Frames reordered for QC, as a compact Deadline frame list."""
+    return FrameSet.parse(frames_string).to_deadline(qc=True)
+
+
+def comp_shot_info(scene_file):
+    """
+    Parse (shot_number, episode, season) from a comp scene path laid out as
+    <season>/<episode>/<shot>/comp/<comp_name>.nk
+    """
+    comp_name = os.path.splitext(os.path.split(scene_file)[-1])[0]
+    name_split = comp_name.split("shot_")[-1].split("_comp")[0]
+    shot_number = int(name_split) if name_split.isdigit() else None
+
+    episode_dir = os.path.dirname(os.path.dirname(os.path.dirname(scene_file)))
+    episode = os.path.basename(episode_dir) or None
+    season = os.path.basename(os.path.dirname(episode_dir)) or None
+    return shot_number, episode, season
+
+
+def farm_time(value):
+    """datetime of a Deadline date string, None for unset dates."""
+    if not value:
+        return None
+    value = value.rstrip("Z").split("+")[0]
+    if "." in value:
+        # .NET writes seven fraction digits
+        value, fraction = value.split(".", 1)
+        value = "{}.{}".format(value, fraction[:6])
+    for fmt in ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            parsed = datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return parsed if parsed.year > 1 else None
+    return None
+
+
+def adaptive_chunk_size(frame_time, load_time, frame_count=None,
+                        target=CHUNK_TARGET_SECONDS, max_chunk=MAX_CHUNK_SIZE):
+    """
+    Frames per Deadline task so that a task, scene load included, takes
+    about target seconds. 1 when there is no render history.
+    """
+    if not frame_time:
+        return 1
+    size = min(int((target - (load_time or 0)) // frame_time), max_chunk)
+    if frame_count:
+        size = min(size, frame_count)
+    return max(1, size)
+
+
+class TimestampedQuerySet(QuerySet):
+    """QuerySet that bumps date_updated on every update."""
+
+    def update(self, *args, **update):
+        if "__raw__" not in update and not any(
+                k.split("__")[-1] == "date_updated" for k in update):
+            update["set__date_updated"] = datetime.datetime.utcnow()
+        return super(TimestampedQuerySet, self).update(*args, **update)
 
 
 class NukeJob(mongoengine.Document):
@@ -65,24 +109,55 @@ class NukeJob(mongoengine.Document):
     nuke_version = mongoengine.StringField(default="11.3")
     render_extension = mongoengine.StringField(default="exr")
     job_id = mongoengine.StringField()
+    shot_number = mongoengine.IntField()
+    episode = mongoengine.StringField()
+    season = mongoengine.StringField()
+
+    meta = {
+            "auto_create_index": False,
+            "index_background": True,
+            "indexes": [
+                "shot_number",
+                ("season", "episode"),
+                "batch_name",
+            ]
+            }
 
     def __str__(self):
         return self.comp_name()
 
+    def clean(self):
+        if self.scene_file:
+            self.shot_number, self.episode, self.season = comp_shot_info(self.scene_file)
+
     def comp_name(self):
         return os.path.splitext(os.path.split(self.scene_file)[-1])[0]
 
     def output_filename(self):
         return "{0}.####.{1}".format(self.comp_name(), self.render_extension)
 
-    def shot_number(self):
-        name_split = self.comp_name().split("shot_")[-1].split("_comp")[0]
-        if name_split.isdigit():
-            return int(name_split)
-
     @queryset_manager
     def by_shotnum(doc_cls, queryset, num):
-        return [j for j in queryset() if j.shot_number() == num]
+        return queryset(shot_number=num)
+
+    @classmethod
+    def backfill_shot_info(cls):
+        """
+        Store shot_number, episode and season on jobs saved before these
+        fields existed. Returns the number of updated documents.
+        """
+        requests = []
+        for doc in cls.objects(shot_number__exists=False).only("scene_file").as_pymongo():
+            shot_number, episode, season = comp_shot_info(doc["scene_file"])
+            requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+                "shot_number": shot_number,
+                "episode": episode,
+                "season": season,
+            }}))
+
+        if requests:
+            cls._get_collection().bulk_write(requests, ordered=False)
+        return len(requests)
 
 class MayaRenderLayer(mongoengine.EmbeddedDocument):
     layer_name = mongoengine.StringField(required=True)
@@ -93,10 +168,20 @@ class MayaRenderLayer(mongoengine.EmbeddedDocument):
     comment = mongoengine.StringField(default="")
     frames = mongoengine.StringField()
     job_id = mongoengine.StringField(default=None)
+    # QC job of a QC first submission, job_id is then the fill job
+    qc_job_id = mongoengine.StringField(default=None)
+    # payload and scene mtime hash of the last submission, see skip_unchanged
+    submission_hash = mongoengine.StringField(default=None)
     renderable = mongoengine.BooleanField(default=True)
+    # farm state, written by deadline_sync
+    status = mongoengine.StringField(default=None)
+    progress = mongoengine.FloatField(default=0.0)
+
+    def frame_set(self):
+        return FrameSet.parse(self.frames or "")
 
     def qc_frames(self):
-        return frame_list(self.frames)
+        return self.frame_set().to_deadline(qc=True)
 
     def __str__(self):
         return "Maya Render Layer - {}".format(self.layer_name)
@@ -106,6 +191,10 @@ class MayaRenderLayer(mongoengine.EmbeddedDocument):
 
 
 class MayaJob(mongoengine.Document):
+    LAYER_FIELDS = (
+        "priority", "frames", "output_directory", "comment", "renderable",
+        "job_id", "qc_job_id", "submission_hash")
+
     batch_name = mongoengine.StringField()
     scene_file = mongoengine.StringField(
         required=True, unique=True, validation=_file_exists)
@@ -119,14 +208,34 @@ class MayaJob(mongoengine.Document):
     status = mongoengine.StringField(choices=("new", "rendering", "error", "done"), default="new")
     has_daily = mongoengine.BooleanField(default=False)
     daily = mongoengine.StringField()
+    daily_status = mongoengine.StringField(default=None)
+    # nuke frames job of a frame dependent daily, daily is then the encode job
+    daily_frames = mongoengine.StringField(default=None)
     date_created = mongoengine.DateTimeField(default=datetime.datetime.utcnow)
     date_updated = mongoengine.DateTimeField(default=datetime.datetime.utcnow)
     render_layers = mongoengine.ListField(
         mongoengine.EmbeddedDocumentField(MayaRenderLayer))
 
+    meta = {
+            "queryset_class": TimestampedQuerySet,
+            "auto_create_index": False,
+            "index_background": True,
+            "indexes": [
+                ("status", "batch_name"),
+                ("batch_name", "id"),
+                ("season", "episode_name"),
+                "-date_updated",
+                {"fields": ["render_layers.job_id"], "sparse": True},
+                {"fields": ["daily"], "sparse": True},
+            ]
+            }
+
     def __str__(self):
         return "Maya Job - {}".format(self.batch_name)
 
+    def clean(self):
+        self.date_updated = datetime.datetime.utcnow()
+
     def layer(self, name):
         lyr = [l for l in self.render_layers if l.layer_name == name]
         return lyr[0] if lyr else None
@@ -137,6 +246,264 @@ class MayaJob(mongoengine.Document):
     def submitted_layers(self):
         return {layer: info["job_id"] for layer, info in self.layers().items() if info["job_id"]}
 
+    def shot_number(self):
+        """Shot number of a <episode>_sc_<shot> batch_name, None if it has none."""
+        shot = self.batch_name.split("sc_")[-1] if "sc_" in (self.batch_name or "") else ""
+        return int(shot) if shot.isdigit() else None
+
+    @classmethod
+    def on_farm(cls):
+        """
+        Jobs with at least one layer or a daily submitted to Deadline that
+        can still change there. Done jobs whose daily is missing, done or
+        deleted are left out, resubmitting sets them back to rendering.
+        """
+        return cls.objects(__raw__={"$and": [
+            {"$or": [
+                {"render_layers.job_id": {"$type": "string"}},
+                {"daily": {"$type": "string"}},
+            ]},
+            {"$or": [
+                {"status": {"$ne": "done"}},
+                {"daily": {"$type": "string"}, "daily_status": {"$nin": FINAL_DAILY_STATUSES}},
+            ]},
+        ]})
+
+    @classmethod
+    def summaries(cls, search_text=None, status=None, after=None, limit=None):
+        """
+        Lightweight (id, batch_name, status) tuples for job lists, sorted by
+        batch_name. Only these fields are fetched and nothing is hydrated.
+
+        Parameters
+        ----------
+        search_text (str) : case insensitive batch_name filter
+        status (str) : only jobs with this status
+        after (tuple) : (batch_name, id) of the last row of the previous page
+        limit (int) : page size
+        """
+        jobs = cls.objects()
+        if search_text:
+            jobs = jobs(batch_name__icontains=search_text)
+        if status:
+            jobs = jobs(status=status)
+        if after:
+            name, _id = after
+            if name is None:
+                # null sorts before every string, "" included
+                jobs = jobs(Q(batch_name=None, id__gt=_id) | Q(batch_name__gte=""))
+            else:
+                jobs = jobs(Q(batch_name__gt=name) | Q(batch_name=name, id__gt=_id))
+
+        jobs = jobs.order_by("batch_name", "id").only("batch_name", "status")
+        if limit:
+            jobs = jobs.limit(limit)
+        return [(j["_id"], j.get("batch_name"), j.get("status", "new")) for j in jobs.as_pymongo()]
+
+    @classmethod
+    def update_layers(cls, job_id, layers, **fields):
+        """
+        Write render layer changes and job fields of one job in a single
+        bulk_write round trip.
+
+        Parameters
+        ----------
+        job_id (ObjectId) : MayaJob id
+        layers (list) : dicts with layer_name and any of LAYER_FIELDS
+        fields : job level fields to set
+        """
+        cls._get_collection().bulk_write(cls.layer_requests(job_id, layers, **fields))
+
+    @classmethod
+    def layer_requests(cls, job_id, layers, **fields):
+        """The UpdateOne requests of update_layers(), to batch several jobs."""
+        fields.setdefault("date_updated", datetime.datetime.utcnow())
+        requests = [UpdateOne({"_id": job_id}, {"$set": fields})]
+
+        for layer in layers:
+            values = {"render_layers.$.{}".format(f): layer[f] for f in cls.LAYER_FIELDS if f in layer}
+            if values:
+                requests.append(UpdateOne(
+                    {"_id": job_id, "render_layers.layer_name": layer["layer_name"]},
+                    {"$set": values}))
+        return requests
+
+
+class RenderTaskStat(mongoengine.EmbeddedDocument):
+    frames = mongoengine.StringField()
+    frame_count = mongoengine.IntField(default=0)
+    load_time = mongoengine.FloatField()
+    render_time = mongoengine.FloatField()
+    peak_ram = mongoengine.IntField()
+    worker = mongoengine.StringField()
+
+    @property
+    def frame_time(self):
+        return self.render_time / self.frame_count if self.frame_count else None
+
+
+class RenderStat(mongoengine.Document):
+    """Render times of one finished render layer job, collected by deadline_sync."""
+
+    job_id = mongoengine.StringField(required=True, unique=True)
+    layer_name = mongoengine.StringField(required=True)
+    batch_name = mongoengine.StringField()
+    episode_name = mongoengine.StringField()
+    season = mongoengine.StringField()
+    chunk_size = mongoengine.IntField(default=1)
+    frame_count = mongoengine.IntField(default=0)
+    task_count = mongoengine.IntField(default=0)
+    # mean seconds rendering one frame and mean seconds per task before the
+    # first frame starts, mostly scene load
+    frame_time = mongoengine.FloatField()
+    load_time = mongoengine.FloatField()
+    peak_ram = mongoengine.IntField()
+    tasks = mongoengine.ListField(mongoengine.EmbeddedDocumentField(RenderTaskStat))
+    date_created = mongoengine.DateTimeField(default=datetime.datetime.utcnow)
+
+    meta = {
+            "auto_create_index": False,
+            "index_background": True,
+            "indexes": [
+                ("layer_name", "batch_name", "-date_created"),
+                ("layer_name", "episode_name", "-date_created"),
+                ("layer_name", "-date_created"),
+                ("season", "episode_name"),
+            ]
+            }
+
+    def __str__(self):
+        return "Render Stat - {} {}".format(self.batch_name, self.layer_name)
+
+    @property
+    def load_overhead(self):
+        """Seconds the farm spent loading the scene for this job."""
+        return (self.load_time or 0) * self.task_count
+
+    @classmethod
+    def from_tasks(cls, job_id, layer_name, tasks, **fields):
+        """
+        RenderStat of the completed tasks of a Deadline job, None when no
+        task has timings.
+
+        Parameters
+        ----------
+        job_id (str) : Deadline job id
+        layer_name (str) : render layer of the job
+        tasks (list) : Deadline task dicts
+        fields : batch_name, episode_name, season
+        """
+        task_stats = []
+        for task in tasks:
+            if task.get("Stat") != TASK_COMPLETED:
+                continue
+            start, render_start, end = (farm_time(task.get(k)) for k in ("Start", "StartRen", "Comp"))
+            if not (start and render_start and end):
+                continue
+            frames = len(FrameSet.parse(task.get("Frames", "")))
+            if not frames:
+                continue
+            task_stats.append(RenderTaskStat(
+                frames=task.get("Frames"), frame_count=frames,
+                load_time=max(0.0, (render_start - start).total_seconds()),
+                render_time=max(0.0, (end - render_start).total_seconds()),
+                peak_ram=task.get("PeakRamUsage") or None,
+                worker=task.get("Slave") or task.get("Worker")))
+
+        if not task_stats:
+            return None
+        frame_count = sum(t.frame_count for t in task_stats)
+        peaks = [t.peak_ram for t in task_stats if t.peak_ram]
+        return cls(
+            job_id=job_id, layer_name=layer_name,
+            chunk_size=max(t.frame_count for t in task_stats),
+            frame_count=frame_count, task_count=len(task_stats),
+            frame_time=sum(t.render_time for t in task_stats) / frame_count,
+            load_time=sum(t.load_time for t in task_stats) / len(task_stats),
+            peak_ram=max(peaks) if peaks else None,
+            tasks=task_stats, **fields)
+
+    @classmethod
+    def estimate(cls, layer_name, batch_name=None, episode_name=None, history=20):
+        """
+        (frame_time, load_time) of a layer from its latest render history,
+        same scene first, then same episode, then any. (None, None) when the
+        layer never rendered.
+        """
+        for query in ({"batch_name": batch_name}, {"episode_name": episode_name}, {}):
+            if None in query.values():
+                continue
+            stats = list(cls.objects(layer_name=layer_name, **query).order_by(
+                "-date_created").limit(history).only(
+                "frame_time", "load_time", "frame_count", "task_count").as_pymongo())
+            frames = sum(s.get("frame_count", 0) for s in stats)
+            tasks = sum(s.get("task_count", 0) for s in stats)
+            if frames and tasks:
+                return (sum(s["frame_time"] * s["frame_count"] for s in stats) / frames,
+                        sum(s["load_time"] * s["task_count"] for s in stats) / tasks)
+        return None, None
+
+    @classmethod
+    def estimates(cls, layer_names, batch_name=None, episode_name=None):
+        """RenderStat.estimate() of several layers, {layer_name: (frame_time, load_time)}."""
+        return {name: cls.estimate(name, batch_name, episode_name) for name in layer_names}
+
+    @classmethod
+    def layer_summary(cls, episode_name=None, season=None):
+        """
+        Per layer render history aggregated on the server.
+
+        Returns {layer_name: dict} with jobs, frames, tasks, frame_time and
+        load_time (weighted means in seconds) and peak_ram (max bytes).
+        """
+        match = {}
+        if episode_name:
+            match["episode_name"] = episode_name
+        if season:
+            match["season"] = season
+        return {row.pop("_id"): row for row in cls._summary(match, "$layer_name")}
+
+    @classmethod
+    def episode_summary(cls, season=None):
+        """Same as layer_summary() grouped by episode, plus render_hours."""
+        match = {"season": season} if season else {}
+        rows = {}
+        for row in cls._summary(match, "$episode_name"):
+            row["render_hours"] = (row["frames"] * (row["frame_time"] or 0) +
+                                   row["tasks"] * (row["load_time"] or 0)) / 3600.0
+            rows[row.pop("_id")] = row
+        return rows
+
+    @classmethod
+    def _summary(cls, match, group_by):
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": group_by,
+                "jobs": {"$sum": 1},
+                "frames": {"$sum": "$frame_count"},
+                "tasks": {"$sum": "$task_count"},
+                "render_seconds": {"$sum": {"$multiply": ["$frame_time", "$frame_count"]}},
+                "load_seconds": {"$sum": {"$multiply": ["$load_time", "$task_count"]}},
+                "peak_ram": {"$max": "$peak_ram"},
+            }},
+            {"$sort": {"_id": 1}},
+        ]
+        for row in cls._get_collection().aggregate(pipeline):
+            render_seconds = row.pop("render_seconds")
+            load_seconds = row.pop("load_seconds")
+            row["frame_time"] = render_seconds / row["frames"] if row["frames"] else None
+            row["load_time"] = load_seconds / row["tasks"] if row["tasks"] else None
+            yield row
+
+    @staticmethod
+    def eta(frame_count, frame_time, load_time, chunk_size=1):
+        """Farm seconds to render frame_count frames, None without history."""
+        if frame_time is None:
+            return None
+        tasks = -(-frame_count // max(1, chunk_size))
+        return frame_count * frame_time + tasks * (load_time or 0)
+
 
 class MayaLight(mongoengine.EmbeddedDocument):
 
@@ -166,15 +533,36 @@ class MayaLightPreset(mongoengine.Document):
 
 
 class DatabaseConnection(object):
-    def __init__(self, db_name, host="localhost", port=27017, alias="default"):
+    """
+    Context manager that makes sure the alias is connected.
+
+    Connections come from the process wide pooled registry and stay open
+    after the block exits. Pass persistent=False to get the old
+    connect/disconnect per block behaviour on a private alias and client,
+    the shared connection of the registry stays untouched for the other
+    threads. Documents are on the private client through
+    Document.objects.using(connection.alias).
+    """
+
+    def __init__(self, db_name, host="localhost", port=27017, alias="default", persistent=True):
         self._db_name = db_name
-        self._alias = alias
         self._host = host
         self._port = port
+        self._persistent = persistent
+        self._alias = alias
+        self.alias = alias
 
     def __enter__(self):
-        self.connection = mongoengine.connect(
-            self._db_name, host=self._host, port=self._port, alias=self._alias)
+        if self._persistent:
+            self.connection = registry.connect(
+                self._db_name, host=self._host, port=self._port, alias=self.alias)
+        else:
+            self.alias = "{}-{}".format(self._alias, uuid.uuid4().hex)
+            self.connection = mongoengine.connect(
+                self._db_name, host=self._host, port=self._port, alias=self.alias)
+        return self.connection
 
     def __exit__(self, type, value, traceback):
-        mongoengine.connection.disconnect(alias=self._alias)
+        if not self._persistent:
+            mongoengine.connection.disconnect(alias=self.alias)
+            self.alias = self._alias
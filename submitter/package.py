@@ -25,3 +25,6 @@ def commands():
     env.PYTHONPATH.append("{root}/python")
 
     alias("submitter", "python {root}/python/submitter_window.py")
+    alias("tz_sync", "python {root}/python/deadline_sync.py")
+    alias("tz_submit", "python {root}/python/bulk_submit.py")
+    alias("tz_reel", "python {root}/python/episode_reel.py")
@@ -0,0 +1,306 @@
+"""
+Benchmarks for the submitter hot paths.
+
+    python benchmarks.py connection --runs 200
+    python benchmarks.py frames --frames 10000
+    python benchmarks.py summaries --jobs 5000 --layers 10
+    python benchmarks.py startup --runs 10 --offline
+    python benchmarks.py dailies --jobs 500 --layers 10
+    python benchmarks.py daily_engines --spec sc_0010.json --nuke Nuke12.2.exe --runs 3
+
+Database benchmarks need a reachable mongo on DB_HOST.
+"""
+import os
+import sys
+import argparse
+import timeit
+import shutil
+import datetime
+import tempfile
+import subprocess
+import collections
+
+from mongo_documents import MayaJob, DatabaseConnection
+from frame_set import FrameSet, _reorder
+from mongo_connection import registry
+import nuke_dailies
+import ffmpeg_daily
+
+DB_NAME = "rendering"
+BENCHMARK_DB_NAME = "rendering_benchmark"
+DBHOST = os.getenv("DB_HOST", "192.168.99.2")
+DBPORT = 27017
+
+
+def timed(func, runs):
+    times = []
+    for _ in range(runs):
+        start = timeit.default_timer()
+        func()
+        times.append((timeit.default_timer() - start) * 1000.0)
+    times.sort()
+    return {
+        "runs": runs,
+        "mean": sum(times) / len(times),
+        "median": times[len(times) // 2],
+        "p95": times[min(len(times) - 1, int(len(times) * 0.95))],
+        "max": times[-1],
+    }
+
+
+def report(name, stats):
+    print("{:<28} runs {runs:>5}  mean {mean:8.2f} ms  median {median:8.2f} ms  "
+          "p95 {p95:8.2f} ms  max {max:8.2f} ms".format(name, **stats))
+
+
+def bench_connection(args):
+    def operation(persistent):
+        db = DatabaseConnection(DB_NAME, DBHOST, DBPORT, persistent=persistent)
+        with db:
+            MayaJob.objects.using(db.alias).only("id").first()
+
+    registry.reset()
+    report("connect per call", timed(lambda: operation(False), args.runs))
+    # first pooled call opens the pool, keep it out of the numbers
+    operation(True)
+    report("pooled registry", timed(lambda: operation(True), args.runs))
+
+
+def _string_frame_list(frames_string):
+    # string based frame_list and get_frame_list as they were before FrameSet
+    frames_string = frames_string.replace(" ", "").split(",")
+    flist = []
+    for f in frames_string:
+        if "-" in f:
+            fr = [int(n) for n in f.split("-")]
+            flist += [str(i) for i in (_reorder(range(fr[0], fr[1]+1)))]
+        else:
+            flist.append(f)
+    return ", ".join(flist)
+
+
+def _string_min_max(frames):
+    frame_list = [int(i) for i in frames.replace(",", "-").split("-") if i.isdigit()]
+    return frame_list[0], frame_list[-1]
+
+
+def bench_frames(args):
+    frames = "1-{}".format(args.frames)
+
+    def string_path():
+        qc = _string_frame_list(frames)
+        _string_min_max(qc)
+        return qc
+
+    def frame_set_path():
+        qc = FrameSet.parse(frames).to_deadline(qc=True)
+        fs = FrameSet.parse(qc)
+        fs.first, fs.last
+        return qc
+
+    print("{} frames, qc string {} chars as strings, {} chars as FrameSet".format(
+        args.frames, len(string_path()), len(frame_set_path())))
+    report("string frame_list", timed(string_path, args.runs))
+    report("FrameSet", timed(frame_set_path, args.runs))
+    report("FrameSet.qc_order", timed(
+        lambda: collections.deque(FrameSet.parse(frames).qc_order(), 0), args.runs))
+    report("FrameSet.chunks(10)", timed(
+        lambda: list(FrameSet.parse(frames).chunks(10)), args.runs))
+
+
+def seed_jobs(jobs, layers):
+    """Insert fake MayaJob documents straight into the collection."""
+    now = datetime.datetime.utcnow()
+    documents = []
+    for j in range(jobs):
+        batch_name = "s_{:03d}_sc_{:04d}".format(j // 100, j)
+        documents.append({
+            "batch_name": batch_name,
+            "scene_file": "Z:\\Projects\\Turbosaurs\\Render_scenes\\{}.ma".format(batch_name),
+            "episode_name": "s_{:03d}".format(j // 100),
+            "season": "Season_01",
+            "camera_name": "renderCam",
+            "camera_list": ["renderCam", "persp", "top", "front", "side"],
+            "status": ("new", "rendering", "error", "done")[j % 4],
+            "date_created": now,
+            "date_updated": now,
+            "render_layers": [{
+                "layer_name": "LAYER_{:02d}".format(l),
+                "batch_name": batch_name,
+                "output_directory": "R:\\Turbosaurs\\{}\\LAYER_{:02d}".format(batch_name, l),
+                "output_filename": "{}_LAYER_{:02d}.####.exr".format(batch_name, l),
+                "priority": 50,
+                "comment": "",
+                "frames": "101-220",
+                "job_id": None,
+                "renderable": True,
+            } for l in range(layers)],
+        })
+    MayaJob._get_collection().insert_many(documents)
+
+
+def bench_summaries(args):
+    def full_documents():
+        return [(j.id, j.batch_name, j.status) for j in MayaJob.objects().order_by("batch_name")]
+
+    with DatabaseConnection(BENCHMARK_DB_NAME, DBHOST, DBPORT) as client:
+        client.drop_database(BENCHMARK_DB_NAME)
+        try:
+            seed_jobs(args.jobs, args.layers)
+            MayaJob.ensure_indexes()
+            print("{} jobs with {} layers each".format(args.jobs, args.layers))
+            report("full documents", timed(full_documents, args.runs))
+            report("MayaJob.summaries", timed(MayaJob.summaries, args.runs))
+            report("summaries search", timed(
+                lambda: MayaJob.summaries("sc_00", "new"), args.runs))
+        finally:
+            client.drop_database(BENCHMARK_DB_NAME)
+            registry.reset()
+
+
+def bench_startup(args):
+    # import time is only paid once per process, measure it separately
+    start = timeit.default_timer()
+    from PyQt5 import QtWidgets
+    import submitter_window
+    print("import submitter_window {:.2f} ms".format((timeit.default_timer() - start) * 1000.0))
+
+    groups, fresh = submitter_window.deadline.cached_group_names()
+    print("{} cached deadline groups, {}".format(len(groups), "fresh" if fresh else "stale"))
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+
+    def open_window():
+        window = submitter_window.SubmitterWindow(offline=args.offline)
+        window.show()
+        app.processEvents()
+        # no closeEvent, it would overwrite the saved window settings
+        window.job_watcher.stop()
+        window.tasks.cancel()
+        window.tasks.wait()
+        window.hide()
+        window.deleteLater()
+
+    report("SubmitterWindow shown", timed(open_window, args.runs))
+
+
+def _daily_template(layers, nodes=300):
+    # a daily sized nk script, read nodes for the layers and filler nodes
+    lines = ["Root {\n first_frame ___FIRST_FRAME___\n last_frame ___LAST_FRAME___\n}"]
+    for n in range(layers):
+        lines.append("Read {{\n file ___layer{0}_IN___filename\n name Read{0}\n}}".format(n))
+    for n in range(nodes):
+        lines.append("Grade {{\n white 1.{0}\n name Grade{0}\n xpos {0}\n}}".format(n))
+    lines.append("Text2 {\n message ___SHOTNAME___\n}")
+    lines.append("Write {\n file ___RENDER_OUTPUT___\n file_type mov\n}")
+    return "\n".join(lines)
+
+
+def _replace_build_daily(info):
+    # nuke_dailies.build_daily as it was, template read and one pass per placeholder
+    first_frame, last_frame = info["frames"].split("-")
+    template_text = nuke_dailies.load_template()
+    template_text = template_text.replace(
+        "___SHOTNAME___", "shot_{}".format(info["batch_name"].split("sc_")[-1]))
+    template_text = template_text.replace("___FIRST_FRAME___", first_frame)
+    template_text = template_text.replace("___LAST_FRAME___", last_frame)
+    output_filename = nuke_dailies.daily_movie(info)
+    template_text = template_text.replace(
+        "___RENDER_OUTPUT___", output_filename.replace("\\", "/"))
+    for layer, filename in info["render_layers"].items():
+        template_text = template_text.replace(
+            "___{}_IN___filename".format(layer), filename.replace("\\", "/"))
+    filename = os.path.join(nuke_dailies.NK_SCRIPTS_ROOT, "dailies", info["batch_name"] + ".nk")
+    nuke_dailies.write_nk_file(template_text, filename)
+    return filename, output_filename
+
+
+def bench_dailies(args):
+    root = tempfile.mkdtemp(prefix="nk_dailies_")
+    os.makedirs(os.path.join(root, "dailies"))
+    nuke_dailies.NK_SCRIPTS_ROOT = root
+    nuke_dailies.DAILIES_TEMPLATE = os.path.join(root, "template")
+    nuke_dailies.write_nk_file(_daily_template(args.layers), nuke_dailies.DAILIES_TEMPLATE)
+    infos = [{
+        "batch_name": "ep_101_sc_{:04d}".format(n),
+        "frames": "1-120",
+        "render_dir": os.path.join(root, "Render_scenes", "ep_101"),
+        "render_layers": {"layer{}".format(i): "//dell/nas/renders/sc_{:04d}/layer{}.####.exr".format(n, i)
+                          for i in range(args.layers)},
+    } for n in range(args.jobs)]
+
+    def episode(build):
+        for info in infos:
+            build(info)
+
+    try:
+        expected = _replace_build_daily(infos[0])
+        with open(expected[0]) as f:
+            expected_text = f.read()
+        nuke_dailies.build_daily(infos[0])
+        with open(expected[0]) as f:
+            assert f.read() == expected_text, "compiled template renders differently"
+
+        runs = args.runs
+        print("{} scripts per run, {} layers each".format(args.jobs, args.layers))
+        report("read + replace per call", timed(lambda: episode(_replace_build_daily), runs))
+        report("cached compiled template", timed(lambda: episode(nuke_dailies.build_daily), runs))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def bench_daily_engines(args):
+    # the same daily through ffmpeg_daily and, with --nuke, the nk script of build_daily
+    # (which writes to its usual movie)
+    spec = ffmpeg_daily.read_spec(args.spec)
+    root = tempfile.mkdtemp(prefix="daily_engines_")
+    spec["movie"] = os.path.join(root, "ffmpeg.mov")
+    runs = args.runs
+
+    def full_render():
+        # without the segments of the last run, everything is merged and encoded
+        shutil.rmtree(ffmpeg_daily.segment_dir(spec["movie"]), ignore_errors=True)
+        ffmpeg_daily.render(spec, args.workers)
+
+    try:
+        print("{} frames, {} layers".format(len(spec["frames"]), len(spec["layers"])))
+        report("ffmpeg_daily", timed(full_render, runs))
+        # segments of the last full render are reused, only the inputs are checked
+        report("ffmpeg_daily unchanged", timed(lambda: ffmpeg_daily.render(spec, args.workers), runs))
+        if args.nuke:
+            script = args.spec[:-len(".json")] + ".nk"
+            frames = "{}-{}".format(min(spec["frames"]), max(spec["frames"]))
+            command = [args.nuke, "-x", "-F", frames, script]
+            report("nuke -x", timed(lambda: subprocess.check_call(command), runs))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+BENCHMARKS = {
+    "connection": bench_connection,
+    "frames": bench_frames,
+    "summaries": bench_summaries,
+    "startup": bench_startup,
+    "dailies": bench_dailies,
+    "daily_engines": bench_daily_engines,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--frames", type=int, default=10000)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--layers", type=int, default=10)
+    parser.add_argument("--spec", help="ffmpeg daily spec, its nk script is next to it")
+    parser.add_argument("--nuke", help="Nuke executable to compare with")
+    parser.add_argument("--workers", type=int, default=ffmpeg_daily.DAILY_WORKERS)
+    parser.add_argument("--offline", action="store_true",
+                        help="startup without the database, jobs from the local cache")
+    args = parser.parse_args(argv)
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Submit MayaJobs to Deadline without the submitter window.
+
+    python bulk_submit.py --season Season_01 --episode ep_101 --dry-run
+    python bulk_submit.py --status new --match "sc_00[1-5]" --group vray
+
+Selects jobs by season, episode, status and a batch_name regex and builds
+the same layer jobs and dailies as SubmitterWindow. All layers go through
+one bounded pool, then the dailies, and the Deadline ids are written back
+with a single bulk_write. Layers unchanged since their last submission keep
+their Deadline jobs (see skip_unchanged), --force submits them again.
+Nothing is asked on the command line and the exit code is 1 when
+anything failed, so it can run as a scheduled task.
+"""
+import os
+import sys
+import argparse
+import datetime
+
+from mongo_documents import MayaJob, DatabaseConnection
+from deadline_client import deadline
+from submission import (
+    SUBMIT_WORKERS, DAILY_ENGINES, DAILY_ENGINE, layer_submission, skip_unchanged, apply_chunk_sizes, submit_layers,
+    collect_job_info, submission_requirements, daily_info, daily_dependencies, DailySubmission, requeue_daily)
+
+DBHOST = os.getenv("DB_HOST", "192.168.99.2")
+DBPORT = 27017
+DEADLINE_GROUP = os.getenv("DEADLINE_GROUP", "none")
+
+
+def log(message):
+    print("{} {}".format(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), message))
+    sys.stdout.flush()
+
+
+def select_jobs(season=None, episode=None, statuses=None, match=None, limit=None):
+    """MayaJobs matching all given filters, sorted by batch_name."""
+    jobs = MayaJob.objects()
+    if season:
+        jobs = jobs(season=season)
+    if episode:
+        jobs = jobs(episode_name=episode)
+    if statuses:
+        jobs = jobs(status__in=statuses)
+    if match:
+        jobs = jobs(__raw__={"batch_name": {"$regex": match}})
+    jobs = jobs.order_by("batch_name")
+    if limit:
+        jobs = jobs.limit(limit)
+    return jobs
+
+
+class JobPlan(object):
+    """Everything that is submitted for one MayaJob."""
+
+    def __init__(self, job, group, qc_first=False):
+        self.job = job
+        self.info = collect_job_info(job)
+        self.layers = self.info.pop("render_layers")
+        self.submissions = [
+            layer_submission(
+                layer, *submission_requirements(self.info, layer, group, job.department),
+                qc_first=qc_first)
+            for layer in self.layers if layer["renderable"]]
+        self.daily = None
+        self.daily_error = None
+        self.daily_requeued = False
+
+    @property
+    def submitted(self):
+        return [s for s in self.submissions if s.ok]
+
+    @property
+    def failed(self):
+        return [s for s in self.submissions if not s.ok]
+
+    @property
+    def changed(self):
+        """Submitted layers that got new or requeued Deadline jobs."""
+        return [s for s in self.submitted if s.skipped != "unchanged"]
+
+    def prepare_daily(self, connection, frame_dependent=False, engine=DAILY_ENGINE):
+        """Requeue the existing daily or build a new one on the submitted layers."""
+        try:
+            if requeue_daily(connection, self.job):
+                self.daily_requeued = True
+                return None
+            info = daily_dependencies(daily_info(dict(self.info), self.layers), self.submitted)
+            self.daily = DailySubmission(info, frame_dependent, engine)
+        except Exception as e:
+            self.daily_error = e
+        return self.daily
+
+    def requests(self):
+        """MayaJob updates of this plan, for one bulk_write with all others."""
+        fields = {"status": "rendering"}
+        if self.daily and self.daily.ok:
+            fields.update(self.daily.fields())
+        return MayaJob.layer_requests(self.job.id, self.layers, **fields)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Submit MayaJobs to Deadline.")
+    parser.add_argument("--season")
+    parser.add_argument("--episode")
+    parser.add_argument("--status", action="append",
+                        help="job status to submit, repeatable, default new")
+    parser.add_argument("--match", help="regular expression on batch_name")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--group", default=DEADLINE_GROUP, help="Deadline group of the layer jobs")
+    parser.add_argument("--workers", type=int, default=SUBMIT_WORKERS,
+                        help="concurrent Deadline submissions")
+    parser.add_argument("--qc-first", action="store_true",
+                        help="submit a high priority QC job per layer, the rest waits for it")
+    parser.add_argument("--no-daily", action="store_true")
+    parser.add_argument("--frame-daily", action="store_true",
+                        help="render dailies frame by frame while the layers render, then encode")
+    parser.add_argument("--daily-engine", choices=DAILY_ENGINES, default=DAILY_ENGINE,
+                        help="ffmpeg merges the layers without Nuke, for plain layer stacks")
+    parser.add_argument("--force", action="store_true",
+                        help="submit layers unchanged since their last submission too")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print what would be submitted, touch nothing")
+    parser.add_argument("--host", default=DBHOST)
+    parser.add_argument("--port", type=int, default=DBPORT)
+    args = parser.parse_args(argv)
+
+    with DatabaseConnection("rendering", args.host, args.port):
+        jobs = select_jobs(args.season, args.episode, args.status or ["new"], args.match, args.limit)
+        plans = []
+        for job in jobs:
+            plan = JobPlan(job, args.group, args.qc_first)
+            plans.append(plan)
+
+        submissions = [s for plan in plans for s in plan.submissions]
+        pending = skip_unchanged(deadline, submissions, args.force, requeue=not args.dry_run)
+        for plan in plans:
+            apply_chunk_sizes([s for s in plan.submissions if s in pending],
+                              plan.job.batch_name, plan.job.episode_name)
+
+        log("{} jobs, {} layers, {} to submit".format(len(plans), len(submissions), len(pending)))
+        for plan in plans:
+            for s in plan.submissions:
+                log("  {:<48} frames {:<20} {}".format(
+                    s.name, s.job_info["Frames"],
+                    s.skipped or "chunk {}".format(s.job_info["ChunkSize"])))
+        if args.dry_run or not submissions:
+            return 0
+
+        try:
+            for n, s in enumerate(submit_layers(deadline, pending, args.workers), 1):
+                log("[{}/{}] {} {}".format(
+                    n, len(pending), s.name, s.job_id if s.ok else "FAILED: {}".format(s.error)))
+
+            if not args.no_daily:
+                dailies = [plan.prepare_daily(deadline, args.frame_daily, args.daily_engine)
+                           for plan in plans if plan.changed]
+                for s in submit_layers(deadline, [d for d in dailies if d], args.workers):
+                    log("daily {} {}".format(s.name, s.job_id if s.ok else "FAILED: {}".format(s.error)))
+        finally:
+            requests = [r for plan in plans if plan.changed for r in plan.requests()]
+            if requests:
+                MayaJob._get_collection().bulk_write(requests, ordered=False)
+
+        failed = 0
+        for plan in plans:
+            failed += len(plan.failed)
+            if plan.daily_error:
+                failed += 1
+                log("daily of {} FAILED: {}".format(plan.job.batch_name, plan.daily_error))
+            elif plan.daily and not plan.daily.ok:
+                failed += 1
+        log("Submitted {} of {} layers, {} failures".format(
+            sum(len(p.submitted) for p in plans), len(submissions), failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Keeps MayaJob status in step with the farm.
+
+Collects the Deadline ids of every submitted render layer and daily, asks
+Deadline for them in batches (one GetJobs request per batch) and writes the
+derived layer status, layer progress, daily status and job status back with
+a single bulk_write. Layers that just finished get their task timings stored
+as a RenderStat for chunk size and ETA estimates. When the QC job of a QC
+first layer fails, its waiting fill job is suspended.
+
+    python deadline_sync.py --interval 30
+    python deadline_sync.py --once
+
+Point it at the local fake of the Deadline web service to try it out:
+
+    python fake_deadline.py --port 8099 &
+    DEADLINE_PULSE=localhost DEADLINE_PORT=8099 python deadline_sync.py --once
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import datetime
+
+from pymongo import UpdateOne
+
+from mongo_documents import MayaJob, RenderStat, DatabaseConnection
+from deadline_client import deadline
+
+DBHOST = os.getenv("DB_HOST", "192.168.99.2")
+DBPORT = 27017
+
+SYNC_INTERVAL = float(os.getenv("DEADLINE_SYNC_INTERVAL", 30))
+BATCH_SIZE = 100
+
+# Deadline job Stat values
+UNKNOWN, ACTIVE, SUSPENDED, COMPLETED, FAILED, PENDING = 0, 1, 2, 3, 4, 6
+
+# layer status missing from the farm, the job was deleted in the monitor
+DELETED = "deleted"
+
+
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def farm_status(farm_job):
+    """Layer status of one Deadline job dict, None if it can't be told."""
+    if farm_job is None:
+        return DELETED
+    stat = farm_job.get("Stat")
+    if stat == COMPLETED:
+        return "done"
+    if stat == FAILED or farm_job.get("FailedChunks"):
+        return "error"
+    if stat == SUSPENDED:
+        return "suspended"
+    if stat == PENDING:
+        return "queued"
+    if stat == ACTIVE:
+        if farm_job.get("RenderingChunks") or farm_job.get("CompletedChunks"):
+            return "rendering"
+        return "queued"
+    return None
+
+
+def farm_progress(farm_job):
+    """Completed tasks of a Deadline job dict in percent."""
+    if not farm_job:
+        return 0.0
+    if farm_job.get("Stat") == COMPLETED:
+        return 100.0
+    total = farm_job.get("Props", {}).get("Tasks") or sum(
+        farm_job.get(key, 0) or 0 for key in (
+            "CompletedChunks", "QueuedChunks", "SuspendedChunks",
+            "RenderingChunks", "FailedChunks", "PendingChunks"))
+    if not total:
+        return 0.0
+    return round(100.0 * (farm_job.get("CompletedChunks") or 0) / total, 1)
+
+
+def job_status(layer_statuses, current):
+    """MayaJob.status from the statuses of its submitted layers."""
+    statuses = [s for s in layer_statuses if s and s != DELETED]
+    if not statuses:
+        return current
+    if "error" in statuses:
+        return "error"
+    if all(s == "done" for s in statuses):
+        return "done"
+    return "rendering"
+
+
+class DeadlineSync(object):
+
+    def __init__(self, connection=deadline, batch_size=BATCH_SIZE):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.requests = 0
+        self.cancelled = []
+
+    def fetch(self, job_ids):
+        """Deadline job dicts by id, one request per batch_size ids."""
+        farm_jobs = {}
+        job_ids = sorted(set(job_ids))
+        for batch in batches(job_ids, self.batch_size):
+            self.requests += 1
+            for farm_job in self.connection.Jobs.GetJobs(batch) or []:
+                farm_jobs[farm_job["_id"]] = farm_job
+        return farm_jobs
+
+    def updates(self, documents, farm_jobs):
+        """
+        UpdateOne requests for the documents whose farm state changed, the
+        (document, layer) pairs that finished since the last sync and the
+        fill jobs whose QC job failed.
+        """
+        now = datetime.datetime.utcnow()
+        requests = []
+        finished = []
+        cancel = []
+        for document in documents:
+            values = {}
+            layer_statuses = []
+            for i, layer in enumerate(document.get("render_layers", [])):
+                if not layer.get("job_id"):
+                    continue
+                farm_job = farm_jobs.get(layer["job_id"])
+                status = farm_status(farm_job)
+                progress = farm_progress(farm_job)
+                if layer.get("qc_job_id") and farm_status(farm_jobs.get(layer["qc_job_id"])) == "error":
+                    if status == "queued":
+                        cancel.append(layer["job_id"])
+                    status = "error"
+                layer_statuses.append(status)
+                if status != layer.get("status"):
+                    values["render_layers.{}.status".format(i)] = status
+                    if status == "done":
+                        finished.append((document, layer))
+                if progress != layer.get("progress"):
+                    values["render_layers.{}.progress".format(i)] = progress
+
+            if document.get("daily"):
+                daily_status = farm_status(farm_jobs.get(document["daily"]))
+                if daily_status != document.get("daily_status"):
+                    values["daily_status"] = daily_status
+
+            status = job_status(layer_statuses, document.get("status"))
+            if status != document.get("status"):
+                values["status"] = status
+
+            if not values:
+                continue
+            values["date_updated"] = now
+            # guard the positional paths against layers edited or resubmitted meanwhile
+            query = {"_id": document["_id"]}
+            for i, layer in enumerate(document.get("render_layers", [])):
+                if "render_layers.{}.status".format(i) in values or \
+                        "render_layers.{}.progress".format(i) in values:
+                    query["render_layers.{}.layer_name".format(i)] = layer["layer_name"]
+                    query["render_layers.{}.job_id".format(i)] = layer["job_id"]
+            requests.append(UpdateOne(query, {"$set": values}))
+        return requests, finished, cancel
+
+    def cancel_fill_jobs(self, job_ids):
+        """Suspend fill jobs still waiting on a failed QC job."""
+        for job_id in job_ids:
+            try:
+                self.connection.Jobs.SuspendJob(job_id)
+            except Exception as e:
+                print("Can't suspend {}: {}".format(job_id, e))
+                continue
+            self.requests += 1
+            self.cancelled.append(job_id)
+
+    def collect_stats(self, finished):
+        """Store a RenderStat for every finished layer, one task request each."""
+        collection = RenderStat._get_collection()
+        for document, layer in finished:
+            try:
+                tasks = self.connection.Tasks.GetJobTasks(layer["job_id"])
+            except Exception as e:
+                print("Can't get tasks of {}: {}".format(layer["job_id"], e))
+                continue
+            self.requests += 1
+            if isinstance(tasks, dict):
+                tasks = tasks.get("Tasks", [])
+            stat = RenderStat.from_tasks(
+                layer["job_id"], layer["layer_name"], tasks or [],
+                batch_name=document.get("batch_name"),
+                episode_name=document.get("episode_name"),
+                season=document.get("season"))
+            if stat:
+                # a requeued job finishes again, keep the latest timings
+                collection.replace_one({"job_id": stat.job_id}, stat.to_mongo(), upsert=True)
+
+    def sync(self):
+        """One pass over all jobs on the farm, returns the number of updated jobs."""
+        documents = list(MayaJob.on_farm().only(
+            "status", "daily", "daily_status", "batch_name", "episode_name", "season",
+            "render_layers.layer_name", "render_layers.job_id", "render_layers.qc_job_id",
+            "render_layers.status", "render_layers.progress").as_pymongo())
+
+        job_ids = []
+        for document in documents:
+            for layer in document.get("render_layers", []):
+                job_ids += [layer[k] for k in ("job_id", "qc_job_id") if layer.get(k)]
+            if document.get("daily"):
+                job_ids.append(document["daily"])
+        if not job_ids:
+            return 0
+
+        requests, finished, cancel = self.updates(documents, self.fetch(job_ids))
+        if requests:
+            MayaJob._get_collection().bulk_write(requests, ordered=False)
+        self.cancel_fill_jobs(cancel)
+        self.collect_stats(finished)
+        return len(requests)
+
+    def run(self, interval=SYNC_INTERVAL, stop=None):
+        """Sync every interval seconds until stop() returns True."""
+        while not (stop and stop()):
+            start = time.time()
+            try:
+                updated = self.sync()
+                print("{} synced {} jobs in {:.2f}s".format(
+                    datetime.datetime.now().strftime("%H:%M:%S"), updated, time.time() - start))
+            except Exception as e:
+                # farm or database down, try again next round
+                print("Sync failed: {}".format(e))
+            time.sleep(max(0.0, interval - (time.time() - start)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync MayaJob status from Deadline.")
+    parser.add_argument("--host", default=DBHOST)
+    parser.add_argument("--port", type=int, default=DBPORT)
+    parser.add_argument("--interval", type=float, default=SYNC_INTERVAL)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--once", action="store_true", help="sync once and exit")
+    args = parser.parse_args(argv)
+
+    stopped = []
+    signal.signal(signal.SIGTERM, lambda *_: stopped.append(True))
+
+    syncer = DeadlineSync(batch_size=args.batch_size)
+    with DatabaseConnection("rendering", args.host, args.port):
+        if args.once:
+            print("Updated {} jobs with {} Deadline requests".format(
+                syncer.sync(), syncer.requests))
+            return 0
+        try:
+            syncer.run(args.interval, stop=lambda: stopped)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Episode reel from the shot dailies, without encoding them again.
+
+    python episode_reel.py --season Season_01 --episode ep_101
+    python episode_reel.py --season Season_01 --episode ep_101 --farm
+    python episode_reel.py --spec //dell/.../ep_101_reel.json
+
+Takes the dailies of all MayaJobs of an episode in shot order, probes them
+with ffprobe and joins them with an ffmpeg concat stream copy. Clips whose
+codec parameters differ from the rest are conformed first, only those are
+encoded. --farm writes the spec and submits one Deadline Python job that
+runs --spec, waiting for dailies still on the farm.
+"""
+import os
+import sys
+import json
+import argparse
+import datetime
+import subprocess
+import collections
+from multiprocessing.pool import ThreadPool
+
+FFMPEG = os.getenv("FARM_FFMPEG", "Z:\\Projects\\RnD\\ffmpeg\\ffmpeg.exe")
+FFPROBE = os.getenv("FARM_FFPROBE", os.path.join(os.path.dirname(FFMPEG), "ffprobe.exe"))
+REEL_WORKERS = int(os.getenv("REEL_WORKERS", 8))
+DBHOST = os.getenv("DB_HOST", "192.168.99.2")
+DBPORT = 27017
+
+# stream parameters the concat demuxer needs to be equal for a stream copy
+CODEC_KEYS = ("codec_name", "profile", "width", "height", "pix_fmt", "r_frame_rate")
+# not every codec has a profile, a clip without any of the others can't be conformed
+OPTIONAL_KEYS = ("profile",)
+
+# daily_status of dailies that will not be written, see deadline_sync.farm_status
+FAILED_DAILY_STATUSES = ("error", "suspended")
+
+# ffprobe h264 profile names to the ones libx264 takes
+X264_PROFILES = {
+    "Baseline": "baseline",
+    "Constrained Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+
+
+def log(message):
+    print("{} {}".format(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), message))
+    sys.stdout.flush()
+
+
+def reel_spec(season, episode, reel=None):
+    """
+    Spec of the reel of an episode and the Deadline ids of its dailies
+    still queued or rendering. Dailies failed on the farm are listed by
+    batch name in spec["failed"]. Needs the database, the farm job only
+    reads the spec.
+    """
+    from mongo_documents import MayaJob, FINAL_DAILY_STATUSES
+    from submission import RENDERS, render_dir
+    import nuke_dailies
+
+    jobs = MayaJob.objects(season=season, episode_name=episode, has_daily=True).only(
+        "batch_name", "scene_file", "daily", "daily_status")
+    jobs = sorted(jobs, key=lambda job: (job.shot_number() is None, job.shot_number(), job.batch_name))
+    clips = [{
+        "batch_name": job.batch_name,
+        "movie": nuke_dailies.daily_movie(
+            {"batch_name": job.batch_name, "render_dir": render_dir(job.scene_file)}),
+    } for job in jobs]
+    failed = [job.batch_name for job in jobs if job.daily_status in FAILED_DAILY_STATUSES]
+    pending = [job.daily for job in jobs if job.daily and
+               job.daily_status not in FINAL_DAILY_STATUSES + list(FAILED_DAILY_STATUSES)]
+    spec = {
+        "episode": episode,
+        "clips": clips,
+        "reel": reel or os.path.join(RENDERS, season, episode, "{}_reel.mov".format(episode)),
+        "ffmpeg": FFMPEG,
+        "ffprobe": FFPROBE,
+        "failed": failed,
+    }
+    return spec, pending
+
+
+def probe(ffprobe, movie):
+    """
+    CODEC_KEYS of the video stream of movie, None if it can't be read or
+    ffprobe left out one of the keys that are not OPTIONAL_KEYS.
+    """
+    try:
+        output = subprocess.check_output([
+            ffprobe, "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "stream=" + ",".join(CODEC_KEYS), "-of", "json", movie])
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    streams = json.loads(output.decode("utf-8")).get("streams")
+    if not streams:
+        return None
+    params = tuple(streams[0].get(key) for key in CODEC_KEYS)
+    if any(value is None for key, value in zip(CODEC_KEYS, params) if key not in OPTIONAL_KEYS):
+        return None
+    return params
+
+
+def conform_command(ffmpeg, movie, params, output):
+    """Encode movie to the codec parameters of the reel."""
+    parameters = dict(zip(CODEC_KEYS, params))
+    command = [
+        ffmpeg, "-y", "-loglevel", "error", "-i", movie, "-an",
+        "-vf", "scale={width}:{height}".format(**parameters),
+        "-r", parameters["r_frame_rate"], "-pix_fmt", parameters["pix_fmt"],
+    ]
+    if parameters["codec_name"] == "h264":
+        command += ["-c:v", "libx264", "-crf", "18"]
+        profile = X264_PROFILES.get(parameters["profile"])
+        if profile:
+            command += ["-profile:v", profile]
+    else:
+        command += ["-c:v", parameters["codec_name"]]
+    return command + [output]
+
+
+def build(spec, workers=REEL_WORKERS):
+    """
+    Write the reel of spec. Returns (clips in the reel, conformed clips,
+    missing clips) as lists of batch names.
+    """
+    clips = spec["clips"]
+    if not os.path.isdir(os.path.dirname(spec["reel"])):
+        os.makedirs(os.path.dirname(spec["reel"]))
+    pool = ThreadPool(workers)
+    try:
+        params = pool.map(lambda clip: probe(spec["ffprobe"], clip["movie"]), clips)
+        missing = [clip["batch_name"] for clip, p in zip(clips, params) if p is None]
+        readable = [(clip, p) for clip, p in zip(clips, params) if p is not None]
+        if not readable:
+            raise IOError("No daily of {} could be read".format(spec["episode"]))
+        clips = [clip for clip, _ in readable]
+        params = [p for _, p in readable]
+
+        # the parameters most dailies share, the odd ones out are conformed to it
+        reel_params = collections.Counter(params).most_common(1)[0][0]
+        directory = os.path.splitext(spec["reel"])[0] + "_conformed"
+        odd = [(clip, os.path.join(directory, "{}.mov".format(clip["batch_name"])))
+               for clip, p in zip(clips, params) if p != reel_params]
+        if odd and not os.path.isdir(directory):
+            os.makedirs(directory)
+        pool.map(lambda item: subprocess.check_call(
+            conform_command(spec["ffmpeg"], item[0]["movie"], reel_params, item[1])), odd)
+    finally:
+        pool.close()
+        pool.join()
+
+    movies = dict((clip["batch_name"], output) for clip, output in odd)
+    list_file = os.path.splitext(spec["reel"])[0] + ".txt"
+    with open(list_file, "w") as f:
+        for clip in clips:
+            movie = movies.get(clip["batch_name"], clip["movie"])
+            f.write("file '{}'\n".format(movie.replace("\\", "/")))
+    subprocess.check_call([
+        spec["ffmpeg"], "-y", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", spec["reel"]])
+    return [clip["batch_name"] for clip in clips], sorted(movies), missing
+
+
+def submit(connection, spec, dependencies):
+    """Write the spec next to the reel and submit the reel job, returns its id."""
+    from submission import reel_requirements
+
+    spec_file = os.path.splitext(spec["reel"])[0] + ".json"
+    with open(spec_file, "w") as f:
+        json.dump(spec, f, indent=2, sort_keys=True)
+    job_info, plugin_info = reel_requirements(spec["episode"], spec_file, spec["reel"], dependencies)
+    return connection.Jobs.SubmitJob(job_info, plugin_info)["_id"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Join the dailies of an episode into a reel.")
+    parser.add_argument("--season")
+    parser.add_argument("--episode")
+    parser.add_argument("--spec", help="build the reel of a spec written by --farm")
+    parser.add_argument("--output", help="reel movie, default <Render>/<season>/<episode>")
+    parser.add_argument("--farm", action="store_true", help="build the reel in one Deadline job")
+    parser.add_argument("--workers", type=int, default=REEL_WORKERS)
+    parser.add_argument("--host", default=DBHOST)
+    parser.add_argument("--port", type=int, default=DBPORT)
+    args = parser.parse_args(argv)
+
+    if args.spec:
+        with open(args.spec, "r") as f:
+            spec = json.load(f)
+    else:
+        if not (args.season and args.episode):
+            parser.error("--season and --episode are needed without --spec")
+        from mongo_documents import DatabaseConnection
+        with DatabaseConnection("rendering", args.host, args.port):
+            spec, pending = reel_spec(args.season, args.episode, args.output)
+        if not spec["clips"]:
+            log("No dailies in {} {}".format(args.season, args.episode))
+            return 1
+        if args.farm:
+            from deadline_client import deadline
+            log("Submitted reel job {} for {} dailies, waiting on {}".format(
+                submit(deadline, spec, pending), len(spec["clips"]), len(pending)))
+            return 0
+
+    log("Joining {} dailies into {}".format(len(spec["clips"]), spec["reel"]))
+    for batch_name in spec.get("failed", []):
+        log("  daily of {} failed on the farm".format(batch_name))
+    joined, conformed, missing = build(spec, args.workers)
+    for batch_name in missing:
+        log("  missing daily of {}".format(batch_name))
+    for batch_name in conformed:
+        log("  conformed {}".format(batch_name))
+    log("Reel of {} shots, {} conformed, {} missing".format(len(joined), len(conformed), len(missing)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Local fake of the parts of the Deadline web service the tools use.
+
+    python fake_deadline.py --port 8099
+    DEADLINE_PULSE=localhost DEADLINE_PORT=8099 python submitter_window.py
+
+Supports GET/POST/PUT /api/jobs, GET /api/tasks and GET /api/groups.
+Submitted jobs start queued; PUT with {"Command": "complete"} or
+{"Command": "fail"} moves them along so deadline_sync has something to pick
+up. Completed jobs report tasks that took load_time seconds to load and
+frame_time seconds per frame. Every request is counted in
+FakeDeadline.requests.
+"""
+import sys
+import json
+import uuid
+import argparse
+import datetime
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import urlparse, parse_qs
+
+from frame_set import FrameSet
+
+# Deadline job Stat values
+ACTIVE, SUSPENDED, COMPLETED, FAILED, PENDING = 1, 2, 3, 4, 6
+TASK_QUEUED, TASK_COMPLETED = 2, 5
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+GROUPS = ["none", "vray", "nuke"]
+
+
+class FakeDeadline(object):
+
+    def __init__(self, groups=GROUPS, load_time=30.0, frame_time=20.0):
+        self.groups = list(groups)
+        self.load_time = load_time
+        self.frame_time = frame_time
+        self.jobs = {}
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def add_job(self, job_id=None, stat=ACTIVE, tasks=10, completed=0, rendering=0,
+                failed=0, **props):
+        job_id = job_id or uuid.uuid4().hex[:24]
+        with self._lock:
+            self.jobs[job_id] = {
+                "_id": job_id,
+                "Stat": stat,
+                "Props": dict(props, Tasks=tasks),
+                "CompletedChunks": completed,
+                "RenderingChunks": rendering,
+                "FailedChunks": failed,
+                "QueuedChunks": tasks - completed - rendering - failed,
+            }
+            return self.jobs[job_id]
+
+    def set_job(self, job_id, **values):
+        with self._lock:
+            job = self.jobs[job_id]
+            job.update(values)
+            job["QueuedChunks"] = max(0, job["Props"]["Tasks"] - job["CompletedChunks"] -
+                                      job["RenderingChunks"] - job["FailedChunks"])
+
+    def tasks(self, job_id):
+        """Deadline task dicts of a job, timed when the job completed."""
+        job = self.jobs[job_id]
+        frames = list(FrameSet.parse(job["Props"].get("Frames", "1")))
+        chunk = max(1, int(job["Props"].get("ChunkSize", 1)))
+        start = datetime.datetime(2020, 1, 1)
+        tasks = []
+        for n, i in enumerate(range(0, len(frames), chunk)):
+            task_frames = FrameSet.from_frames(frames[i:i + chunk])
+            task = {"TaskID": n, "Frames": task_frames.to_deadline(), "Stat": TASK_QUEUED}
+            if job["Stat"] == COMPLETED:
+                render_start = start + datetime.timedelta(seconds=self.load_time)
+                end = render_start + datetime.timedelta(
+                    seconds=self.frame_time * len(task_frames))
+                task.update({
+                    "Stat": TASK_COMPLETED,
+                    "Slave": "render{:02d}".format(n % 8),
+                    "PeakRamUsage": 8 * 1024 ** 3,
+                    "Start": start.strftime(DATE_FORMAT),
+                    "StartRen": render_start.strftime(DATE_FORMAT),
+                    "Comp": end.strftime(DATE_FORMAT),
+                })
+                start = end
+            tasks.append(task)
+        return tasks
+
+    def command(self, job_id, command):
+        job = self.jobs.get(job_id)
+        if not job:
+            return False
+        tasks = job["Props"]["Tasks"]
+        if command == "complete":
+            self.set_job(job_id, Stat=COMPLETED, CompletedChunks=tasks, RenderingChunks=0, FailedChunks=0)
+        elif command == "fail":
+            self.set_job(job_id, Stat=FAILED, FailedChunks=1)
+        elif command == "suspend":
+            self.set_job(job_id, Stat=SUSPENDED, RenderingChunks=0)
+        elif command in ("resume", "requeue"):
+            self.set_job(job_id, Stat=ACTIVE, CompletedChunks=0, RenderingChunks=0, FailedChunks=0)
+        else:
+            return False
+        return True
+
+    def handle(self, method, path, query, body):
+        """Return (status code, json response) of one request."""
+        self.requests.append((method, path, query))
+        if path == "/api/groups" and method == "GET":
+            return 200, self.groups
+
+        if path == "/api/tasks" and method == "GET":
+            job_id = query.get("JobID", [""])[0]
+            if job_id not in self.jobs:
+                return 404, "Job not found"
+            return 200, {"JobID": job_id, "Tasks": self.tasks(job_id)}
+
+        if path != "/api/jobs":
+            return 404, "Not found"
+
+        if method == "GET":
+            if "JobID" not in query:
+                return 200, list(self.jobs.values())
+            ids = ",".join(query["JobID"]).split(",")
+            return 200, [self.jobs[i] for i in ids if i in self.jobs]
+
+        if method == "POST":
+            job_info = body.get("JobInfo", {})
+            frames = len(FrameSet.parse(job_info.get("Frames", "1")))
+            chunk = max(1, int(job_info.get("ChunkSize", 1)))
+            waits = any(key.startswith("JobDependency") for key in job_info)
+            job = self.add_job(stat=PENDING if waits else ACTIVE, tasks=-(-frames // chunk), **job_info)
+            return 200, {"_id": job["_id"]} if body.get("IdOnly") else job
+
+        if method == "PUT":
+            if self.command(body.get("JobID"), body.get("Command", "").lower()):
+                return 200, "Success"
+            return 400, "Unknown job or command"
+
+        return 405, "Method not allowed"
+
+
+def make_handler(fake):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _respond(self, method):
+            url = urlparse(self.path)
+            body = {}
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                body = json.loads(self.rfile.read(length).decode("utf-8"))
+            code, response = fake.handle(method, url.path, parse_qs(url.query), body)
+            data = json.dumps(response).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._respond("GET")
+
+        def do_POST(self):
+            self._respond("POST")
+
+        def do_PUT(self):
+            self._respond("PUT")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(fake=None, host="localhost", port=0):
+    """Start the fake in a daemon thread, returns (server, fake)."""
+    fake = fake or FakeDeadline()
+    server = HTTPServer((host, port), make_handler(fake))
+    thread = threading.Thread(target=server.serve_forever, name="fake_deadline")
+    thread.daemon = True
+    thread.start()
+    return server, fake
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Deadline web service.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args(argv)
+
+    server = HTTPServer((args.host, args.port), make_handler(FakeDeadline()))
+    print("Fake Deadline on http://{}:{}".format(args.host, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""
+Daily movie of a job without Nuke.
+
+Reads the exr sequences of the render layers, merges them frame by frame
+with NumPy in a pool of processes and pipes the frames to ffmpeg in order.
+The movie is joined from fixed length segments, a requeued daily only
+encodes the segments whose layer frames changed.
+
+Meant for plain layer stacks, it runs as a Deadline Python job on any
+worker (see submission.ffmpeg_daily_requirements) with a spec written by
+write_spec():
+
+    python ffmpeg_daily.py //dell/.../nk_dailies/dailies/ep_101_sc_0010.json
+
+Needs numpy and OpenImageIO on the worker, the submitter only writes the
+spec. The merge stack of a spec is a list of layers from the bottom up:
+
+    [{"layer": "BG"}, {"layer": "CHAR", "op": "over"},
+     {"layer": "AO_Pass", "op": "multiply", "mix": 0.8}]
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import itertools
+import subprocess
+import collections
+import multiprocessing
+
+try:
+    import numpy as np
+    import OpenImageIO as oiio
+except ImportError:
+    np = oiio = None
+
+DAILY_WORKERS = int(os.getenv("DAILY_WORKERS", 0)) or multiprocessing.cpu_count()
+GAMMA = 2.2
+
+# frames per segment file, a changed input frame re-encodes its segment only
+SEGMENT_FRAMES = int(os.getenv("DAILY_SEGMENT_FRAMES", 48))
+
+# json merge stack of the studio, its layers come first in its order
+DAILY_STACK = os.getenv("DAILY_STACK")
+
+# merge operation of a layer when the stack doesn't say, everything else goes over
+DEFAULT_OPERATIONS = {
+    "AO_Pass": "multiply",
+    "matteShadow": "multiply",
+}
+
+_stack = None
+
+
+def merge_stack(layer_names, configured=None):
+    """
+    Merge stack of layer_names. Layers of the configured stack keep its
+    order and settings, the others follow sorted, over layers before the
+    multiplied passes.
+    """
+    if configured is None and DAILY_STACK:
+        configured = read_spec(DAILY_STACK)
+    stack = [dict(item) for item in configured or [] if item["layer"] in layer_names]
+    known = set(item["layer"] for item in stack)
+    rest = sorted((name for name in layer_names if name not in known),
+                  key=lambda name: (DEFAULT_OPERATIONS.get(name, "over") != "over", name))
+    return stack + [{"layer": name, "op": DEFAULT_OPERATIONS.get(name, "over"), "mix": 1.0}
+                    for name in rest]
+
+
+def daily_spec(info, movie, fps, ffmpeg, stack=None):
+    """The spec of a daily, info as returned by submission.daily_info()."""
+    from frame_set import FrameSet
+    return {
+        "batch_name": info["batch_name"],
+        "frames": list(FrameSet.parse(info["frames"])),
+        "layers": info["render_layers"],
+        "stack": stack or merge_stack(list(info["render_layers"])),
+        "movie": movie,
+        "fps": fps,
+        "ffmpeg": ffmpeg,
+    }
+
+
+def write_spec(filename, spec):
+    with open(filename, "w") as f:
+        json.dump(spec, f, indent=2, sort_keys=True)
+    return filename
+
+
+def read_spec(filename):
+    with open(filename, "r") as f:
+        return json.load(f)
+
+
+def frame_path(sequence, frame):
+    return sequence.replace("####", "{:04d}".format(frame))
+
+
+def read_rgba(filename):
+    """Float32 premultiplied RGBA pixels of an image, None if it can't be read."""
+    image = oiio.ImageInput.open(filename)
+    if not image:
+        return None
+    try:
+        pixels = image.read_image(oiio.FLOAT)
+    finally:
+        image.close()
+    if pixels is None:
+        return None
+    pixels = np.asarray(pixels, dtype=np.float32)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, np.newaxis]
+    channels = pixels.shape[2]
+    if channels == 1:
+        # single channel passes like AO act on all of rgb
+        return np.concatenate([np.repeat(pixels, 3, axis=2), np.ones_like(pixels)], axis=2)
+    if channels == 3:
+        return np.concatenate([pixels, np.ones_like(pixels[:, :, :1])], axis=2)
+    return pixels[:, :, :4]
+
+
+def merge(operation, a, b, mix=1.0):
+    """Layer a merged onto b like the Nuke Merge node of the same name."""
+    if operation == "over":
+        out = a + b * (1.0 - a[:, :, 3:4])
+    elif operation == "plus":
+        out = a + b
+    elif operation == "multiply":
+        out = b.copy()
+        out[:, :, :3] = a[:, :, :3] * b[:, :, :3]
+    elif operation == "screen":
+        out = a + b - a * b
+    else:
+        raise ValueError("Unknown merge operation {}".format(operation))
+    if mix != 1.0:
+        out = b + (out - b) * mix
+    return out
+
+
+def composite(frame, layers, stack):
+    """(width, height, rgb24 bytes, missing layers) of one frame of the merged stack."""
+    result = None
+    missing = []
+    for item in stack:
+        pixels = read_rgba(frame_path(layers[item["layer"]], frame))
+        if pixels is None:
+            # like ContinueOnError of the Nuke daily, the layer is left out
+            missing.append(item["layer"])
+            continue
+        if result is None:
+            result = pixels
+        else:
+            result = merge(item.get("op", "over"), pixels, result, item.get("mix", 1.0))
+    if result is None:
+        raise IOError("No layer of frame {} could be read".format(frame))
+    rgb = np.clip(result[:, :, :3], 0.0, 1.0) ** (1.0 / GAMMA)
+    return result.shape[1], result.shape[0], (rgb * 255.0 + 0.5).astype(np.uint8).tobytes(), missing
+
+
+def _init_worker(layers, stack):
+    global _stack
+    _stack = (layers, stack)
+
+
+def _composite(frame):
+    return composite(frame, *_stack)
+
+
+def encode_command(ffmpeg, width, height, fps, movie):
+    return [
+        ffmpeg, "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", "{}x{}".format(width, height),
+        "-framerate", str(fps), "-i", "-",
+        # yuv420p needs even dimensions
+        "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-crf", "18", movie,
+    ]
+
+
+def concat_command(ffmpeg, list_file, movie):
+    """Join segments of the same encode settings without encoding again."""
+    return [ffmpeg, "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", movie]
+
+
+def file_sha1(filename):
+    digest = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def input_state(layers, frames, previous=None):
+    """
+    {path: [mtime, size, sha1]} of the layer files of frames, None for
+    missing files. Files with the mtime and size of previous keep its sha1
+    instead of being read again.
+    """
+    previous = previous or {}
+    state = {}
+    for frame in frames:
+        for sequence in layers.values():
+            path = frame_path(sequence, frame)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                state[path] = None
+                continue
+            known = previous.get(path)
+            if known and known[:2] == [stat.st_mtime, stat.st_size]:
+                state[path] = known
+            else:
+                state[path] = [stat.st_mtime, stat.st_size, file_sha1(path)]
+    return state
+
+
+def _contents(state):
+    # a re-render with identical pixels only touches the mtime
+    return {path: value and value[1:] for path, value in (state or {}).items()}
+
+
+def settings_key(spec, segment_frames):
+    """Hash of everything but the input frames that shapes the segments."""
+    settings = [spec["layers"], spec["stack"], spec["fps"], segment_frames, GAMMA,
+                encode_command("ffmpeg", 0, 0, spec["fps"], "")]
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def segment_dir(movie):
+    return os.path.splitext(movie)[0] + "_segments"
+
+
+def _pool(spec, workers):
+    if np is None:
+        raise ImportError("ffmpeg dailies need numpy and OpenImageIO")
+    return multiprocessing.Pool(workers, _init_worker, (spec["layers"], spec["stack"]))
+
+
+def composited(pool, frames, workers=DAILY_WORKERS):
+    """
+    Composited (frame, width, height, data, missing layers) of frames in
+    order. At most 2 * workers frames are in flight, so memory stays flat
+    however long the shot is.
+    """
+    todo = iter(frames)
+    pending = collections.deque(
+        (frame, pool.apply_async(_composite, (frame,)))
+        for frame in itertools.islice(todo, 2 * workers))
+    while pending:
+        frame, result = pending.popleft()
+        next_frame = next(todo, None)
+        if next_frame is not None:
+            pending.append((next_frame, pool.apply_async(_composite, (next_frame,))))
+        width, height, data, missing = result.get()
+        yield frame, width, height, data, missing
+
+
+def encode(pool, spec, frames, movie, workers=DAILY_WORKERS, progress=None):
+    """Merge frames and encode them to movie."""
+    encoder = None
+    size = None
+    try:
+        for frame, width, height, data, missing in composited(pool, frames, workers):
+            if encoder is None:
+                size = (width, height)
+                encoder = subprocess.Popen(
+                    encode_command(spec["ffmpeg"], width, height, spec["fps"], movie),
+                    stdin=subprocess.PIPE)
+            elif (width, height) != size:
+                # raw video has no frame boundaries, a bigger frame would shift all that follow
+                raise ValueError("Frame {} is {}x{}, the frames before are {}x{}".format(
+                    frame, width, height, size[0], size[1]))
+            if missing:
+                print("Frame {} without {}".format(frame, ", ".join(missing)))
+            encoder.stdin.write(data)
+            if progress:
+                progress(1)
+    finally:
+        if encoder:
+            encoder.stdin.close()
+            encoder.wait()
+    if encoder and encoder.returncode != 0:
+        raise RuntimeError("ffmpeg failed with exit code {}".format(encoder.returncode))
+
+
+def render(spec, workers=DAILY_WORKERS, segment_frames=SEGMENT_FRAMES):
+    """
+    Write the movie of spec from segments of segment_frames frames. Only
+    the segments whose input files changed since the last run, as recorded
+    in the manifest of the segment dir, are merged and encoded again. The
+    movie is then joined from all segments with a stream copy.
+
+    Returns the number of frames merged.
+    """
+    movie = spec["movie"]
+    directory = segment_dir(movie)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    manifest_file = os.path.join(directory, "manifest.json")
+    settings = settings_key(spec, segment_frames)
+    manifest = read_spec(manifest_file) if os.path.isfile(manifest_file) else {}
+    if manifest.get("settings") != settings:
+        manifest = {"settings": settings, "segments": {}}
+    segments = manifest["segments"]
+
+    all_frames = spec["frames"]
+    parts = [all_frames[i:i + segment_frames] for i in range(0, len(all_frames), segment_frames)]
+    done = [0]
+    merged = 0
+
+    def progress(count):
+        # Deadline picks the task progress up from stdout
+        done[0] += count
+        print("Progress: {}%".format(100 * done[0] // len(all_frames)))
+        sys.stdout.flush()
+
+    pool = None
+    files = []
+    try:
+        for n, frames in enumerate(parts):
+            filename = os.path.join(directory, "{:04d}.mov".format(n))
+            files.append(filename)
+            entry = segments.get(str(n)) or {}
+            inputs = input_state(spec["layers"], frames, entry.get("inputs"))
+            if (os.path.isfile(filename) and entry.get("frames") == frames and
+                    _contents(entry.get("inputs")) == _contents(inputs)):
+                progress(len(frames))
+            else:
+                # a segment that fails half way must not look finished next time
+                segments.pop(str(n), None)
+                write_spec(manifest_file, manifest)
+                pool = pool or _pool(spec, workers)
+                encode(pool, spec, frames, filename, workers, progress)
+                merged += len(frames)
+            segments[str(n)] = {"frames": frames, "inputs": inputs}
+            write_spec(manifest_file, manifest)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    for stale in [key for key in segments if int(key) >= len(parts)]:
+        del segments[stale]
+    write_spec(manifest_file, manifest)
+
+    list_file = os.path.join(directory, "segments.txt")
+    with open(list_file, "w") as f:
+        for filename in files:
+            f.write("file '{}'\n".format(filename.replace("\\", "/")))
+    subprocess.check_call(concat_command(spec["ffmpeg"], list_file, movie))
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assemble a daily movie with ffmpeg.")
+    parser.add_argument("spec", help="json spec written by write_spec()")
+    parser.add_argument("--workers", type=int, default=DAILY_WORKERS)
+    parser.add_argument("--segment-frames", type=int, default=SEGMENT_FRAMES)
+    args = parser.parse_args(argv)
+
+    spec = read_spec(args.spec)
+    count = render(spec, args.workers, args.segment_frames)
+    print("Merged {} of {} frames into {}".format(count, len(spec["frames"]), spec["movie"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+On-disk read-through cache of MayaJob documents.
+
+Every opened job is stored as a BSON file named after its id. Reopening a
+job only asks the database for its date_updated and reuses the file when it
+matches. In offline mode the database is not touched at all and only
+cached jobs can be listed and opened, read only.
+"""
+import os
+import tempfile
+
+import bson
+from bson.errors import BSONError
+from pymongo.errors import ServerSelectionTimeoutError, AutoReconnect
+
+from mongo_documents import MayaJob
+
+CACHE_DIR = os.getenv(
+    "SUBMITTER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "submitter_job_cache"))
+
+# errors that mean the database host can't be reached
+OFFLINE_ERRORS = (ServerSelectionTimeoutError, AutoReconnect)
+
+
+class JobCache(object):
+
+    def __init__(self, root=CACHE_DIR, offline=False):
+        self.root = root
+        self.offline = offline
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+
+    def _path(self, job_id):
+        return os.path.join(self.root, "{}.bson".format(job_id))
+
+    def read(self, job_id):
+        try:
+            with open(self._path(job_id), "rb") as f:
+                return bson.BSON(f.read()).decode()
+        except (IOError, OSError, BSONError):
+            return None
+
+    def write(self, document):
+        path = self._path(document["_id"])
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(bson.BSON.encode(document))
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
+
+    def remove(self, job_id):
+        path = self._path(job_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def get(self, job_id):
+        """
+        Return the MayaJob with job_id, from disk when it is still fresh.
+        Falls back to the cached copy and switches to offline mode when the
+        database can't be reached.
+        """
+        cached = self.read(job_id)
+        if self.offline:
+            return MayaJob._from_son(cached) if cached else None
+
+        try:
+            if cached:
+                fresh = MayaJob.objects(id=job_id).only("date_updated").as_pymongo().first()
+                if fresh is None:
+                    self.remove(job_id)
+                    return None
+                if fresh.get("date_updated") == cached.get("date_updated"):
+                    return MayaJob._from_son(cached)
+
+            document = MayaJob.objects(id=job_id).as_pymongo().first()
+        except OFFLINE_ERRORS:
+            self.offline = True
+            return MayaJob._from_son(cached) if cached else None
+
+        if document is None:
+            self.remove(job_id)
+            return None
+        self.write(document)
+        return MayaJob._from_son(document)
+
+    def summaries(self, search_text=None, status=None):
+        """MayaJob.summaries() over the cached jobs, for offline mode."""
+        jobs = []
+        for filename in os.listdir(self.root):
+            if not filename.endswith(".bson"):
+                continue
+            document = self.read(os.path.splitext(filename)[0])
+            if not document:
+                continue
+            batch_name = document.get("batch_name")
+            if search_text and search_text.lower() not in (batch_name or "").lower():
+                continue
+            if status and document.get("status") != status:
+                continue
+            jobs.append((document["_id"], batch_name, document.get("status", "new")))
+        return sorted(jobs, key=lambda j: (j[1] is not None, j[1] or "", str(j[0])))
@@ -0,0 +1,210 @@
+import bisect
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+JOB_ID_ROLE = QtCore.Qt.UserRole + 1
+STATUS_ROLE = QtCore.Qt.UserRole + 2
+
+STATUS_COLOURS = {
+    "new": QtGui.QColor("#2d2d2d"),
+    "rendering": QtGui.QColor("#6D562E"),
+    "error": QtGui.QColor("#690000"),
+    "done": QtGui.QColor("#1F684D"),
+}
+
+
+class JobQuery(object):
+    """Server side filter of the job list, search text and status."""
+
+    def __init__(self, search_text="", status=None):
+        self.search_text = search_text or ""
+        self.status = status
+
+    def matches(self, batch_name, status):
+        if self.search_text.lower() not in (batch_name or "").lower():
+            return False
+        return not self.status or self.status == status
+
+    def narrows(self, other):
+        """True if every job matching self also matches other."""
+        if other.search_text.lower() not in self.search_text.lower():
+            return False
+        return not other.status or other.status == self.status
+
+
+class JobListModel(QtCore.QAbstractListModel):
+    """
+    Job summaries fetched page by page as the view scrolls.
+
+    fetch_page(query, after, limit) returns (id, batch_name, status) tuples
+    sorted by batch_name, starting after the (batch_name, id) of the last
+    loaded row. With a TaskRunner pages are fetched in the background.
+    """
+
+    ROW_HEIGHT = 25
+
+    page_loaded = QtCore.pyqtSignal()
+    page_failed = QtCore.pyqtSignal(object)
+
+    def __init__(self, fetch_page, page_size=200, runner=None, parent=None):
+        super(JobListModel, self).__init__(parent)
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.runner = runner
+        self.query = JobQuery()
+        self._jobs = []
+        self._keys = []
+        self._exhausted = False
+        self._loading = False
+        self._generation = 0
+
+    @property
+    def exhausted(self):
+        return self._exhausted
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._jobs)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        job_id, batch_name, status = self._jobs[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return batch_name
+        if role == JOB_ID_ROLE:
+            return job_id
+        if role == STATUS_ROLE:
+            return status
+        if role == QtCore.Qt.SizeHintRole:
+            return QtCore.QSize(self.ROW_HEIGHT, self.ROW_HEIGHT)
+        return None
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and not self._exhausted and not self._loading
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        after = None
+        if self._jobs:
+            after = (self._jobs[-1][1], self._jobs[-1][0])
+        args = (self.query, after, self.page_size)
+
+        if not self.runner:
+            self._add_page(self._generation, self.fetch_page(*args))
+            return
+
+        self._loading = True
+        generation = self._generation
+        self.runner.run(
+            self.fetch_page, args, name="fetch_jobs",
+            on_result=lambda page: self._add_page(generation, page),
+            on_error=lambda e: self._page_failed(generation, e))
+
+    def _page_failed(self, generation, error):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self.page_failed.emit(error)
+
+    def _add_page(self, generation, page):
+        if generation != self._generation:
+            # result of a query that was replaced meanwhile
+            return
+        self._loading = False
+        self._exhausted = len(page) < self.page_size
+        if page:
+            first = len(self._jobs)
+            self.beginInsertRows(QtCore.QModelIndex(), first, first + len(page) - 1)
+            for job in page:
+                self._jobs.append(list(job))
+                self._keys.append(self._sort_key(job[1], job[0]))
+            self.endInsertRows()
+        self.page_loaded.emit()
+
+    def set_query(self, query):
+        if self.runner:
+            self.runner.cancel("fetch_jobs")
+        self.beginResetModel()
+        self.query = query
+        self._jobs = []
+        self._keys = []
+        self._exhausted = False
+        self._loading = False
+        self._generation += 1
+        self.endResetModel()
+
+    def find_row(self, job_id):
+        for row, job in enumerate(self._jobs):
+            if job[0] == job_id:
+                return row
+        return -1
+
+    def set_status(self, job_id, status):
+        row = self.find_row(job_id)
+        if row < 0:
+            return
+        self._jobs[row][2] = status
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [STATUS_ROLE])
+
+    def remove_job(self, job_id):
+        row = self.find_row(job_id)
+        if row < 0:
+            return
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self._jobs[row]
+        del self._keys[row]
+        self.endRemoveRows()
+
+    def apply_change(self, operation, job_id, job):
+        """Apply a JobWatcher change without refetching the list."""
+        if operation == "delete" or not self.query.matches(job["batch_name"], job["status"]):
+            self.remove_job(job_id)
+            return
+
+        row = self.find_row(job_id)
+        if row >= 0 and self._jobs[row][1] == job["batch_name"]:
+            self.set_status(job_id, job["status"])
+            return
+
+        self.remove_job(job_id)
+        key = self._sort_key(job["batch_name"], job_id)
+        row = bisect.bisect(self._keys, key)
+        if row == len(self._jobs) and not self._exhausted:
+            # belongs to a page that is not loaded yet
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self._jobs.insert(row, [job_id, job["batch_name"], job["status"]])
+        self._keys.insert(row, key)
+        self.endInsertRows()
+
+    @staticmethod
+    def _sort_key(batch_name, job_id):
+        return (batch_name is not None, batch_name or "", str(job_id))
+
+
+class JobFilterProxyModel(QtCore.QSortFilterProxyModel):
+    """Filters already fetched jobs locally, no database round trip."""
+
+    def __init__(self, parent=None):
+        super(JobFilterProxyModel, self).__init__(parent)
+        self.query = JobQuery()
+
+    def set_query(self, query):
+        self.query = query
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        index = self.sourceModel().index(source_row, 0, source_parent)
+        return self.query.matches(index.data(QtCore.Qt.DisplayRole), index.data(STATUS_ROLE))
+
+
+class JobStatusDelegate(QtWidgets.QStyledItemDelegate):
+    """Paints the row background in the colour of the job status."""
+
+    def initStyleOption(self, option, index):
+        super(JobStatusDelegate, self).initStyleOption(option, index)
+        colour = STATUS_COLOURS.get(index.data(STATUS_ROLE))
+        if colour:
+            option.backgroundBrush = QtGui.QBrush(colour)
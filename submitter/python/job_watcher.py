@@ -0,0 +1,153 @@
+"""
+Background watcher for MayaJob changes.
+
+Uses a change stream when the server is a replica set, otherwise polls
+date_updated with a cursor and diffs the job ids to find deletes.
+Changes are reported as on_change(operation, job_id, document) with
+operation one of "insert", "update" or "delete" (document is None).
+
+Try it against a local single node replica set:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 & mongo --eval "rs.initiate()"
+    python job_watcher.py --host localhost
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from mongo_documents import MayaJob, DatabaseConnection
+
+DBHOST = os.getenv("DB_HOST", "192.168.99.2")
+DBPORT = 27017
+
+# fields the job list needs, kept in sync with job_list.JobListModel.apply_change
+FIELDS = ("batch_name", "status", "date_updated")
+
+
+class JobWatcher(object):
+
+    def __init__(self, on_change, poll_interval=5.0, use_change_streams=True):
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.use_change_streams = use_change_streams
+        self.mode = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._resume_token = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="job_watcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self):
+        collection = MayaJob._get_collection()
+        while not self._stop.is_set():
+            try:
+                if self.use_change_streams:
+                    self.mode = "change_stream"
+                    self._watch(collection)
+                else:
+                    self.mode = "polling"
+                    self._poll(collection)
+            except OperationFailure as e:
+                # change streams need a replica set (code 40573 on standalone)
+                print("Change streams unavailable, polling: {}".format(e))
+                self.use_change_streams = False
+            except PyMongoError as e:
+                print("Job watcher lost the database: {}".format(e))
+                self._stop.wait(self.poll_interval)
+
+    def _watch(self, collection):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        with collection.watch(pipeline, full_document="updateLookup",
+                              resume_after=self._resume_token,
+                              max_await_time_ms=1000) as stream:
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    continue
+                self._resume_token = stream.resume_token
+                self._emit_change(change)
+
+    def _emit_change(self, change):
+        operation = change["operationType"]
+        job_id = change["documentKey"]["_id"]
+        if operation == "delete":
+            self.on_change("delete", job_id, None)
+            return
+
+        document = change.get("fullDocument")
+        if document is None:
+            # deleted again before the lookup happened
+            return
+        document = {k: document.get(k) for k in FIELDS}
+        self.on_change("insert" if operation == "insert" else "update", job_id, document)
+
+    def _poll(self, collection):
+        projection = dict.fromkeys(FIELDS, 1)
+        latest = collection.find_one({}, {"date_updated": 1}, sort=[("date_updated", -1)])
+        cursor = latest["date_updated"] if latest else None
+        known = set(d["_id"] for d in collection.find({}, {"_id": 1}))
+        # (_id, date_updated) already reported at the cursor, writes can land
+        # in the same millisecond as the cursor so it is queried with $gte
+        seen = set((d["_id"], cursor) for d in collection.find({"date_updated": cursor}, {"_id": 1})) \
+            if cursor else set()
+
+        while not self._stop.wait(self.poll_interval):
+            query = {"date_updated": {"$gte": cursor}} if cursor else {}
+            for document in collection.find(query, projection).sort("date_updated", 1):
+                job_id = document.pop("_id")
+                updated = document.get("date_updated")
+                if (job_id, updated) in seen:
+                    continue
+                if updated and (cursor is None or updated > cursor):
+                    cursor = updated
+                    seen = set()
+                seen.add((job_id, updated))
+                self.on_change("update" if job_id in known else "insert", job_id, document)
+                known.add(job_id)
+
+            current = set(d["_id"] for d in collection.find({}, {"_id": 1}))
+            for job_id in known - current:
+                self.on_change("delete", job_id, None)
+            known = current
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print MayaJob changes as they happen.")
+    parser.add_argument("--host", default=DBHOST)
+    parser.add_argument("--port", type=int, default=DBPORT)
+    parser.add_argument("--poll", action="store_true", help="skip change streams")
+    args = parser.parse_args(argv)
+
+    def report(operation, job_id, document):
+        print("{:<7} {} {}".format(operation, job_id, document or ""))
+
+    with DatabaseConnection("rendering", args.host, args.port):
+        watcher = JobWatcher(report, use_change_streams=not args.poll)
+        watcher.start()
+        try:
+            while watcher.is_running():
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            watcher.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,38 +1,102 @@
 import os
+import re
+import threading
 
 NK_SCRIPTS_ROOT = "\\\\dell\\StudioRepository\\DeadlineRepository\\nk_dailies"
 DAILIES_TEMPLATE = os.path.join(NK_SCRIPTS_ROOT, "template")
 
+# ___NAME___ placeholders, layer inputs are ___<layer>_IN___filename, and the
+# write node file type that sequence dailies switch to jpeg
+PLACEHOLDER = re.compile(r"___\w+?___(?:filename)?|file_type mov")
 
-def load_template():
-    with open(DAILIES_TEMPLATE, "r") as f:
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+class Template(object):
+    """A template split once at its placeholders, rendered in one pass."""
+
+    def __init__(self, text):
+        self.parts = PLACEHOLDER.split(text)
+        self.placeholders = PLACEHOLDER.findall(text)
+
+    def render(self, values):
+        """The template text with every placeholder found in values replaced."""
+        out = [self.parts[0]]
+        for placeholder, part in zip(self.placeholders, self.parts[1:]):
+            out.append(values.get(placeholder, placeholder))
+            out.append(part)
+        return "".join(out)
+
+
+def load_template(path=None):
+    path = path or DAILIES_TEMPLATE
+    with open(path, "r") as f:
         return f.read()
 
 
+def compiled_template(path=None):
+    """
+    The Template of path, read from the share again only when its mtime
+    changed.
+    """
+    path = path or DAILIES_TEMPLATE
+    mtime = os.path.getmtime(path)
+    with _templates_lock:
+        cached = _templates.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    template = Template(load_template(path))
+    with _templates_lock:
+        _templates[path] = (mtime, template)
+    return template
+
+
 def write_nk_file(text, filename):
     with open(filename, "w") as f:
         f.write(text)
 
 
-def build_daily(info):
-    first_frame, last_frame = info["frames"].split("-")
-    template_text = load_template()
-    template_text = template_text.replace(
-        "___SHOTNAME___", "shot_{}".format(info["batch_name"].split("sc_")[-1]))
-    template_text = template_text.replace("___FIRST_FRAME___", first_frame)
-    template_text = template_text.replace("___LAST_FRAME___", last_frame)
-
+def daily_dir(info):
     render_dir = info["render_dir"].replace("Render_scenes", "Render")
     render_dir = render_dir.replace("Z:\\Projects\\Turbosaurs", "//dell/nas/Projects/Turbosaurs")
-    output_filename = os.path.join(
-        render_dir, "dailies", "{}.mov".format(info["batch_name"]))
-
-    template_text = template_text.replace(
-        "___RENDER_OUTPUT___", output_filename.replace("\\", "/"))
-    render_layers = info["render_layers"]
-    for layer, filename in render_layers.items():
-        template_text = template_text.replace(
-            "___{}_IN___filename".format(layer), filename.replace("\\", "/"))
+    return os.path.join(render_dir, "dailies")
+
+
+def daily_movie(info):
+    return os.path.join(daily_dir(info), "{}.mov".format(info["batch_name"]))
+
+
+def daily_sequence(info):
+    """jpeg frames of a frame dependent daily, encoded to daily_movie() afterwards."""
+    return os.path.join(daily_dir(info), info["batch_name"], "{}.####.jpg".format(info["batch_name"]))
+
+
+def build_daily(info, sequence=False):
+    """
+    Write the daily nk script of a job, returns (nk file, output). With
+    sequence the write node renders daily_sequence() frames instead of the
+    movie.
+    """
+    first_frame, last_frame = info["frames"].split("-")
+    values = {
+        "___SHOTNAME___": "shot_{}".format(info["batch_name"].split("sc_")[-1]),
+        "___FIRST_FRAME___": first_frame,
+        "___LAST_FRAME___": last_frame,
+    }
+
+    if sequence:
+        output_filename = daily_sequence(info)
+        if not os.path.isdir(os.path.dirname(output_filename)):
+            os.makedirs(os.path.dirname(output_filename))
+        values["file_type mov"] = "file_type jpeg"
+    else:
+        output_filename = daily_movie(info)
+
+    values["___RENDER_OUTPUT___"] = output_filename.replace("\\", "/")
+    for layer, filename in info["render_layers"].items():
+        values["___{}_IN___filename".format(layer)] = filename.replace("\\", "/")
+    template_text = compiled_template().render(values)
 
     filename = os.path.join(NK_SCRIPTS_ROOT, "dailies",
                             info["batch_name"]+".nk")
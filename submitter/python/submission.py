@@ -0,0 +1,600 @@
+import os
+import json
+import hashlib
+import itertools
+from multiprocessing.pool import ThreadPool
+
+from mongo_documents import RenderStat, adaptive_chunk_size
+from frame_set import FrameSet, listed_in_order
+import nuke_dailies
+import ffmpeg_daily
+from deadline_sync import farm_status, DELETED
+
+SUBMIT_WORKERS = int(os.getenv("DEADLINE_SUBMIT_WORKERS", 4))
+
+# frames and priority of the QC job in QC first mode
+QC_FRAMES = int(os.getenv("QC_FRAMES", 5))
+QC_PRIORITY = int(os.getenv("QC_PRIORITY", 90))
+
+# frame dependent dailies render DAILY_CHUNK_SIZE frames per task, then
+# FFMPEG on the farm encodes the movie
+DAILY_CHUNK_SIZE = int(os.getenv("DAILY_CHUNK_SIZE", 10))
+DAILY_FPS = int(os.getenv("DAILY_FPS", 25))
+FFMPEG = os.getenv("FARM_FFMPEG", "Z:\\Projects\\RnD\\ffmpeg\\ffmpeg.exe")
+
+# "nuke" renders the daily template, "ffmpeg" merges the layers with
+# ffmpeg_daily.py in a Python job, no Nuke license needed
+DAILY_ENGINES = ("nuke", "ffmpeg")
+DAILY_ENGINE = os.getenv("DAILY_ENGINE", "nuke")
+DAILY_GROUP = os.getenv("DAILY_GROUP", "none")
+DAILY_PYTHON = os.getenv("DAILY_PYTHON_VERSION", "3.7")
+FFMPEG_DAILY_SCRIPT = os.getenv(
+    "FFMPEG_DAILY_SCRIPT", os.path.join(nuke_dailies.NK_SCRIPTS_ROOT, "ffmpeg_daily.py"))
+EPISODE_REEL_SCRIPT = os.getenv(
+    "EPISODE_REEL_SCRIPT", os.path.join(nuke_dailies.NK_SCRIPTS_ROOT, "episode_reel.py"))
+
+# job_info keys that don't change what gets rendered, left out of the hash
+UNHASHED_KEYS = ("ChunkSize", "Priority", "Comment")
+
+PROJECT = "Turbosaurs"
+PROJECTS_PATH = os.getenv("PROJECTS_PATH", "Z:\\Projects")
+RENDER_SCENES = os.path.join(PROJECTS_PATH, PROJECT, "Render_scenes")
+RENDERS = os.path.join("\\\\dell\\Projects", PROJECT, "Render")
+
+
+def payload_hash(job_info, plugin_info, *extra):
+    """Stable hash of what a Deadline job renders."""
+    payload = {
+        "job_info": {k: v for k, v in job_info.items()
+                     if k not in UNHASHED_KEYS and not k.startswith("JobDependency")},
+        "plugin_info": plugin_info,
+        "extra": extra,
+    }
+    text = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def scene_mtime(scene_file):
+    try:
+        return os.path.getmtime(scene_file)
+    except (OSError, TypeError):
+        return None
+
+
+class LayerSubmission(object):
+    """One render layer on its way to Deadline and the outcome of the call."""
+
+    MODE = "layer"
+
+    def __init__(self, layer, job_info, plugin_info):
+        self.layer = layer
+        self.job_info = job_info
+        self.plugin_info = plugin_info
+        self.job_id = None
+        self.qc_job_id = None
+        self.error = None
+        self.skipped = None
+        self.load_saved = 0.0
+        # taken before a QC split changes the frames
+        self.submission_hash = None
+        self._payload = (dict(job_info), dict(plugin_info))
+
+    @property
+    def ok(self):
+        return self.job_id is not None
+
+    @property
+    def name(self):
+        return self.job_info.get("Name") or (self.layer or {}).get("name")
+
+    @property
+    def job_ids(self):
+        """Deadline ids a daily of this layer has to wait for."""
+        return [i for i in (self.qc_job_id, self.job_id) if i]
+
+    def payload_hash(self):
+        """Hash of the job payload and the scene file mtime, stats the scene."""
+        job_info, plugin_info = self._payload
+        return payload_hash(job_info, plugin_info, self.MODE,
+                            scene_mtime(plugin_info.get("SceneFile")))
+
+    def reuse(self, reason):
+        """Keep the Deadline jobs of the last submission instead of submitting."""
+        self.skipped = reason
+        self.job_id = self.layer["job_id"]
+        self.qc_job_id = self.layer.get("qc_job_id")
+
+    def submit(self, connection, cancelled=None):
+        if cancelled and cancelled():
+            self.error = "Cancelled"
+            return self
+        try:
+            self._submit(connection)
+        except Exception as e:
+            self.error = e
+        return self
+
+    def _submit(self, connection):
+        self.job_id = connection.Jobs.SubmitJob(self.job_info, self.plugin_info)["_id"]
+        if self.layer is not None:
+            self.layer["job_id"] = self.job_id
+            self.layer["qc_job_id"] = None
+            self.layer["submission_hash"] = self.submission_hash
+
+
+class QcLayerSubmission(LayerSubmission):
+    """
+    A layer split in two Deadline jobs: a high priority QC job of the first,
+    last and a few midpoint frames, and a fill job of the other frames that
+    depends on it. A failed QC job keeps the fill job from starting.
+    """
+
+    MODE = "qc"
+
+    def __init__(self, layer, job_info, plugin_info, qc_frames=QC_FRAMES):
+        super(QcLayerSubmission, self).__init__(layer, job_info, plugin_info)
+        frames = FrameSet.parse(job_info["Frames"])
+        self.qc_frames = FrameSet.from_frames(itertools.islice(frames.qc_order(), qc_frames))
+        self.job_info["Frames"] = (frames - self.qc_frames).to_deadline()
+
+    def _submit(self, connection):
+        qc_info = dict(
+            self.job_info,
+            Name="{} - QC".format(self.name),
+            Frames=self.qc_frames.to_deadline(),
+            ChunkSize="1",
+            Priority=max(int(self.job_info.get("Priority", 50)), QC_PRIORITY))
+        self.qc_job_id = connection.Jobs.SubmitJob(qc_info, self.plugin_info)["_id"]
+        if self.layer is not None:
+            self.layer["qc_job_id"] = self.qc_job_id
+
+        fill_info = dict(self.job_info, JobDependency0=self.qc_job_id)
+        self.job_id = connection.Jobs.SubmitJob(fill_info, self.plugin_info)["_id"]
+        if self.layer is not None:
+            self.layer["job_id"] = self.job_id
+            self.layer["submission_hash"] = self.submission_hash
+
+
+def layer_submission(layer, job_info, plugin_info, qc_first=False, qc_frames=QC_FRAMES):
+    """QcLayerSubmission in QC first mode when the layer has frames left for a fill job."""
+    if qc_first and len(FrameSet.parse(job_info["Frames"])) > qc_frames:
+        return QcLayerSubmission(layer, job_info, plugin_info, qc_frames)
+    return LayerSubmission(layer, job_info, plugin_info)
+
+
+def skip_unchanged(connection, submissions, force=False, requeue=True):
+    """
+    Hash every submission and keep the Deadline jobs of layers whose hash
+    matches their last submission. Queued, rendering or done jobs are left
+    alone, failed or suspended ones are requeued (only marked without
+    requeue). All last jobs are looked up with one GetJobs call. force
+    submits everything.
+
+    Returns the submissions that still have to be submitted.
+    """
+    for submission in submissions:
+        submission.submission_hash = submission.payload_hash()
+    if force:
+        return list(submissions)
+
+    candidates = [
+        s for s in submissions
+        if s.layer and s.layer.get("job_id") and
+        s.layer.get("submission_hash") == s.submission_hash]
+    farm_jobs = {}
+    if candidates:
+        job_ids = [s.layer[k] for s in candidates for k in ("qc_job_id", "job_id") if s.layer.get(k)]
+        farm_jobs = {j["_id"]: j for j in connection.Jobs.GetJobs(job_ids) or []}
+
+    pending = []
+    for submission in submissions:
+        if submission not in candidates:
+            pending.append(submission)
+            continue
+        layer_ids = [submission.layer[k] for k in ("qc_job_id", "job_id") if submission.layer.get(k)]
+        statuses = set(farm_status(farm_jobs.get(i)) for i in layer_ids)
+        if statuses <= set(("queued", "rendering", "done")):
+            submission.reuse("unchanged")
+        elif statuses & set(("error", "suspended")) and DELETED not in statuses:
+            submission.reuse("requeued")
+            for job_id in layer_ids if requeue else []:
+                connection.Jobs.RequeueJob(job_id)
+                connection.Jobs.ResumeJob(job_id)
+        else:
+            # gone from the farm
+            pending.append(submission)
+    return pending
+
+
+def collect_job_info(job):
+    """SubmitterWindow.collect_info() of a MayaJob, straight from the document."""
+    return {
+        "batch_name": job.batch_name,
+        "scene_file": job.scene_file,
+        "camera_name": job.camera_name,
+        "render_layers": [{
+            "name": layer.name(),
+            "layer_name": layer.layer_name,
+            "batch_name": job.batch_name,
+            "renderable": layer.renderable,
+            "output_directory": layer.output_directory,
+            "output_filename": layer.output_filename,
+            "comment": layer.comment,
+            "priority": layer.priority,
+            "job_id": layer.job_id,
+            "qc_job_id": layer.qc_job_id,
+            "submission_hash": layer.submission_hash,
+            "frames": layer.frames,
+        } for layer in job.render_layers],
+    }
+
+
+def store_submitted(render_layers, layers):
+    """
+    Copy the Deadline ids and submission hash of submitted layer dicts back
+    onto the MayaRenderLayers they were collected from, so the next submit
+    of the same job compares against them.
+    """
+    submitted = dict((layer["layer_name"], layer) for layer in layers)
+    for render_layer in render_layers:
+        layer = submitted.get(render_layer.layer_name)
+        if layer is None:
+            continue
+        render_layer.job_id = layer.get("job_id")
+        render_layer.qc_job_id = layer.get("qc_job_id")
+        render_layer.submission_hash = layer.get("submission_hash")
+
+
+def submission_requirements(info, layer, group, department="lighting"):
+    """(job_info, plugin_info) of one MayaBatch render layer job."""
+    job_info = {
+        "BatchName": info["batch_name"],
+        "Group": group,
+        "Department": department,
+        "Frames": layer["frames"],
+        "Name": layer["name"],
+        "Priority": layer["priority"],
+        "OutputDirectory0": layer["output_directory"],
+        "OutputFilename0": layer["output_filename"],
+        "Comment": layer["comment"],
+        "EnvironmentKeyValue0": "MAYA_MODULE_PATH=\\\\dell\\StudioRepository\\twa_pipeline\\render",
+        "OverrideTaskExtraInfoNames": "False",
+        "Plugin": "MayaBatch",
+        "UserName": "admin",
+        "ChunkSize": "1",
+    }
+
+    plugin_info = {
+        "Animation": 1,
+        "Build": "64bit",
+        "Camera": info["camera_name"],
+        "SceneFile": info["scene_file"],
+        "OutputFilePath": layer["output_directory"],
+        "RenderLayer": layer["layer_name"],
+        "FrameNumberOffset": 0,
+        "IgnoreError211": 0,
+        "ImageHeight": 1080,
+        "ImageWidth": 1920,
+        "OutputFilePrefix": "<Scene>_<Layer>",
+        "RenderSetupIncludeLights": "1",
+        "Renderer": "vray",
+        "StrictErrorChecking": "0",
+        "UseLegacyRenderLayers": "1",
+        "UseLocalAssetCaching": "0",
+        "UsingRenderLayers": "1",
+        "VRayAutoMemoryBuffer": "500",
+        "VRayAutoMemoryEnabled": "0",
+        "Version": "2020",
+    }
+
+    return (job_info, plugin_info)
+
+
+def daily_requirements(info, frame_dependent=False):
+    """
+    (job_info, plugin_info) of the Nuke daily of a job, info as returned by
+    daily_info(). Writes the daily nk script. A frame dependent daily renders
+    a jpeg sequence in small chunks, each frame as soon as all layers have it.
+    """
+    dependencies = info["dependencies"]
+    if None in dependencies:
+        raise ValueError("You need to submitte job to be able to create dailiy.")
+
+    scene_file, output_filename = nuke_dailies.build_daily(info, sequence=frame_dependent)
+    output_filename = output_filename.replace("Render_scenes", "Render")
+    job_info = {
+        "BatchName": info["batch_name"],
+        "Name": "{} - Daily".format(info["batch_name"]),
+        "ChunkSize": "1000",
+        "Department": "lighting",
+        "EventOptIns": "",
+        "Frames": info["frames"],
+        "OutputFilename0": output_filename,
+        "Group": "nuke",
+        "OverrideTaskExtraInfoNames": "False",
+        "Plugin": "Nuke",
+        "Priority": "80",
+        "UserName": "admin",
+    }
+    for n, d in enumerate(dependencies):
+        job_info["JobDependency{}".format(n)] = d
+    plugin_info = {
+        "BatchMode": "True",
+        "BatchModeIsMovie": "True",
+        "ContinueOnError": "True",
+        "EnforceRenderOrder": "False",
+        "GpuOverride": "0",
+        "NukeX": "True",
+        "PerformanceProfiler": "False",
+        "RamUse": "0",
+        "RenderMode": "Use Scene Settings",
+        "SceneFile": scene_file,
+        "StackSize": "0",
+        "Threads": "0",
+        "UseGpu": "False",
+        "Version": "11.3",
+        "Views": "",
+        "WriteNode": "COMP_OUT",
+    }
+    if frame_dependent:
+        job_info["ChunkSize"] = str(DAILY_CHUNK_SIZE)
+        job_info["IsFrameDependent"] = "true"
+        plugin_info["BatchModeIsMovie"] = "False"
+    return (job_info, plugin_info)
+
+
+def encode_requirements(info, sequence, dependency):
+    """(job_info, plugin_info) of the ffmpeg job turning a daily sequence into the movie."""
+    first_frame = FrameSet.parse(info["frames"]).first
+    movie = nuke_dailies.daily_movie(info)
+    arguments = (
+        '-y -framerate {fps} -start_number {first} -i "{sequence}" '
+        '-c:v libx264 -pix_fmt yuv420p -crf 18 "{movie}"').format(
+            fps=DAILY_FPS, first=first_frame,
+            sequence=sequence.replace("####", "%04d"), movie=movie)
+    job_info = {
+        "BatchName": info["batch_name"],
+        "Name": "{} - Daily encode".format(info["batch_name"]),
+        "Department": "lighting",
+        "Frames": "0",
+        "ChunkSize": "1",
+        "OutputFilename0": movie,
+        "Group": "nuke",
+        "Plugin": "CommandLine",
+        "Priority": "80",
+        "UserName": "admin",
+        "JobDependency0": dependency,
+    }
+    plugin_info = {
+        "Executable": FFMPEG,
+        "Arguments": arguments,
+        "Shell": "default",
+        "ShellExecute": "False",
+        "StartupDirectory": "",
+    }
+    return (job_info, plugin_info)
+
+
+def ffmpeg_daily_requirements(info):
+    """
+    (job_info, plugin_info) of a daily merged by ffmpeg_daily.py, info as
+    returned by daily_info(). Writes the spec next to the nk dailies.
+    """
+    dependencies = info["dependencies"]
+    if None in dependencies:
+        raise ValueError("You need to submitte job to be able to create dailiy.")
+
+    movie = nuke_dailies.daily_movie(info)
+    spec_file = ffmpeg_daily.write_spec(
+        os.path.join(nuke_dailies.NK_SCRIPTS_ROOT, "dailies", info["batch_name"] + ".json"),
+        ffmpeg_daily.daily_spec(info, movie, DAILY_FPS, FFMPEG))
+    job_info = {
+        "BatchName": info["batch_name"],
+        "Name": "{} - Daily".format(info["batch_name"]),
+        "Department": "lighting",
+        # one task, ffmpeg needs the frames in order
+        "Frames": "0",
+        "ChunkSize": "1",
+        "OutputFilename0": movie,
+        "Group": DAILY_GROUP,
+        "Plugin": "Python",
+        "Priority": "80",
+        "UserName": "admin",
+    }
+    for n, d in enumerate(dependencies):
+        job_info["JobDependency{}".format(n)] = d
+    plugin_info = {
+        "ScriptFile": FFMPEG_DAILY_SCRIPT,
+        "Arguments": '"{}"'.format(spec_file),
+        "Version": DAILY_PYTHON,
+        "SingleFramesOnly": "False",
+    }
+    return (job_info, plugin_info)
+
+
+def reel_requirements(episode_name, spec_file, reel, dependencies=()):
+    """(job_info, plugin_info) of the episode_reel.py job joining the dailies of an episode."""
+    job_info = {
+        "BatchName": episode_name,
+        "Name": "{} - Reel".format(episode_name),
+        "Department": "lighting",
+        "Frames": "0",
+        "ChunkSize": "1",
+        "OutputFilename0": reel,
+        "Group": DAILY_GROUP,
+        "Plugin": "Python",
+        "Priority": "70",
+        "UserName": "admin",
+    }
+    for n, d in enumerate(dependencies):
+        job_info["JobDependency{}".format(n)] = d
+    plugin_info = {
+        "ScriptFile": EPISODE_REEL_SCRIPT,
+        "Arguments": '--spec "{}"'.format(spec_file),
+        "Version": DAILY_PYTHON,
+        "SingleFramesOnly": "False",
+    }
+    return (job_info, plugin_info)
+
+
+class DailySubmission(LayerSubmission):
+    """
+    Daily of a job. A frame dependent daily is two jobs, the Nuke frames
+    and the encode waiting for them; job_id is then the encode job. It
+    falls back to waiting for whole jobs when a layer job doesn't render
+    every frame, see frame_dependencies(). The ffmpeg engine is always a
+    single job.
+    """
+
+    def __init__(self, info, frame_dependent=False, engine=DAILY_ENGINE):
+        if engine not in DAILY_ENGINES:
+            raise ValueError("Unknown daily engine {}".format(engine))
+        if engine == "ffmpeg":
+            frame_dependent = False
+            requirements = ffmpeg_daily_requirements(info)
+        else:
+            # Deadline makes all dependencies of a job frame dependent or none
+            frame_dependent = frame_dependent and set(info["dependencies"]) <= set(
+                info.get("frame_dependencies", ()))
+            requirements = daily_requirements(info, frame_dependent)
+        super(DailySubmission, self).__init__(None, *requirements)
+        self.info = info
+        self.engine = engine
+        self.frame_dependent = frame_dependent
+        self.frames_job_id = None
+
+    def _submit(self, connection):
+        if not self.frame_dependent:
+            return super(DailySubmission, self)._submit(connection)
+        self.frames_job_id = connection.Jobs.SubmitJob(self.job_info, self.plugin_info)["_id"]
+        encode_info, encode_plugin = encode_requirements(
+            self.info, self.job_info["OutputFilename0"], self.frames_job_id)
+        self.job_id = connection.Jobs.SubmitJob(encode_info, encode_plugin)["_id"]
+
+    def fields(self):
+        """MayaJob fields recording this daily."""
+        return {"daily": self.job_id, "daily_frames": self.frames_job_id, "has_daily": True}
+
+
+def requeue_daily(connection, job):
+    """Requeue the daily of a MayaJob if it is still on the farm, True if it was."""
+    if not (job.has_daily and job.daily and connection.Jobs.GetJob(job.daily)):
+        return False
+    if job.daily_frames:
+        connection.Jobs.RequeueJob(job.daily_frames)
+    connection.Jobs.RequeueJob(job.daily)
+    return True
+
+
+def frame_dependencies(frames, layers):
+    """
+    Job ids of the layers a daily of frames can wait for frame by frame,
+    the plain jobs rendering every frame of the daily. QC and fill jobs each
+    render part of the frames and shorter layers miss some, a daily task
+    waiting on them per frame could wait for frames no job renders.
+    """
+    return [layer["job_id"] for layer in layers
+            if not layer.get("qc_job_id") and not frames - FrameSet.parse(layer["frames"])]
+
+
+def daily_dependencies(info, submitted):
+    """
+    Set the dependencies of a daily to the jobs of the submitted layers.
+    The daily is only frame dependent when all of them are in
+    frame_dependencies, otherwise it waits for the whole jobs.
+    """
+    info["dependencies"] = [i for s in submitted for i in s.job_ids]
+    info["frame_dependencies"] = frame_dependencies(
+        FrameSet.parse(info["frames"]), [s.layer for s in submitted])
+    return info
+
+
+def daily_info(info, layers):
+    """
+    Daily settings of a job from its info dict and render layer dicts:
+    frame range, write node outputs, layer job dependencies and render dir.
+    frame_dependencies are the jobs a frame dependent daily can wait for
+    frame by frame, see frame_dependencies().
+    """
+    render_layers = dict()
+    frames = FrameSet()
+    dependencies = []
+    for layer in layers:
+        frames = frames | FrameSet.parse(layer["frames"])
+        dependencies.append(layer["job_id"])
+        if layer.get("qc_job_id"):
+            dependencies.append(layer["qc_job_id"])
+        scene_name = os.path.split(
+            os.path.dirname(layer["output_directory"]))[-1]
+        layer_name = layer["layer_name"]
+        write_name = layer["layer_name"]
+
+        if layer_name == "FLOOR_AO":
+            for fp in ["AO_Pass", "matteShadow"]:
+                write_name = fp
+                output_filename = "{}_{}.{}.####.exr".format(
+                    scene_name, layer_name, fp)
+                output_filename = os.path.join(
+                    layer["output_directory"], fp, output_filename)
+                render_layers[write_name] = output_filename
+        else:
+            output_filename = "{}_{}.####.exr".format(
+                scene_name, layer_name)
+            output_filename = os.path.join(
+                layer["output_directory"], output_filename)
+            render_layers[write_name] = output_filename
+
+    info["frames"] = "{}-{}".format(frames.first, frames.last)
+    info["render_layers"] = render_layers
+    info["dependencies"] = dependencies
+    info["frame_dependencies"] = frame_dependencies(FrameSet.parse(info["frames"]), layers)
+    info["render_dir"] = render_dir(info["scene_file"])
+    return info
+
+
+def render_dir(scene_file):
+    """Render folder of a maya scene, its dailies folder is in there."""
+    return os.path.dirname(scene_file.replace(RENDER_SCENES, RENDERS))
+
+
+def apply_chunk_sizes(submissions, batch_name=None, episode_name=None, **chunk_options):
+    """
+    Set the ChunkSize of every submission from the render history of its
+    layer. Frame lists out of order, like the QC order, keep one frame per
+    task so Deadline renders them in that order. Returns the estimated
+    seconds of scene loading saved compared to one frame per task.
+    """
+    saved = 0.0
+    for submission in submissions:
+        frame_time, load_time = RenderStat.estimate(
+            submission.layer["layer_name"], batch_name, episode_name)
+        frame_count = len(FrameSet.parse(submission.job_info["Frames"]))
+        chunk_size = adaptive_chunk_size(frame_time, load_time, frame_count, **chunk_options)
+        if not listed_in_order(submission.job_info["Frames"]):
+            chunk_size = 1
+        submission.job_info["ChunkSize"] = str(chunk_size)
+
+        tasks = -(-frame_count // chunk_size)
+        submission.load_saved = (frame_count - tasks) * (load_time or 0)
+        saved += submission.load_saved
+    return saved
+
+
+def submit_layers(connection, submissions, workers=SUBMIT_WORKERS, cancelled=None):
+    """
+    Submit layers to Deadline through a bounded thread pool.
+
+    Yields every LayerSubmission as soon as its call returned, failed ones
+    included, so one bad layer doesn't stop the others. Once cancelled()
+    returns True the layers not started yet are skipped.
+    """
+    if not submissions:
+        return
+    pool = ThreadPool(max(1, min(workers, len(submissions))))
+    try:
+        for submission in pool.imap_unordered(
+                lambda s: s.submit(connection, cancelled), submissions):
+            yield submission
+    finally:
+        pool.close()
+        pool.join()
@@ -3,58 +3,50 @@ import os
 import subprocess
 from PyQt5 import QtCore, QtWidgets, QtGui, uic
 
-from Deadline.DeadlineConnect import DeadlineCon
-from mongo_documents import MayaRenderLayer, MayaJob, DatabaseConnection, frame_list
-
-import nuke_dailies
+from mongo_documents import (
+    MayaRenderLayer, MayaJob, RenderStat, DatabaseConnection, frame_list, adaptive_chunk_size)
+from frame_set import FrameSet
+from deadline_client import deadline
+
+from job_watcher import JobWatcher
+from job_cache import JobCache, OFFLINE_ERRORS
+from submission import (
+    layer_submission, skip_unchanged, apply_chunk_sizes, submit_layers, submission_requirements,
+    store_submitted, daily_info, daily_dependencies, DailySubmission, requeue_daily)
+from tasks import TaskRunner
+from job_list import (
+    JobListModel, JobFilterProxyModel, JobStatusDelegate, JobQuery,
+    JOB_ID_ROLE, STATUS_COLOURS)
 
 SMBT_ROOT = os.path.abspath(os.path.dirname(__file__))
 ICONDIR = os.path.join(SMBT_ROOT, "icons")
 
-PROJECT = "Turbosaurs"
-PROJECTS_PATH = os.getenv("PROJECTS_PATH", "Z:\\Projects")
-RENDER_SCENES = os.path.join(PROJECTS_PATH, PROJECT, "Render_scenes")
-RENDERS = os.path.join("\\\\dell\\Projects", PROJECT, "Render")
-
 DBHOST = os.getenv("DB_HOST", "192.168.99.2")
-PULSE_NAME = "dell"
 DBPORT = 27017
-
-DEADLINE_PORT = 8082
-DEADLINE_LOGIN = "admin"
-DEADLINE_PASSWORD = "123"
-
-deadline_connection = DeadlineCon(PULSE_NAME, DEADLINE_PORT)
-deadline_connection.SetAuthenticationCredentials(
-    DEADLINE_LOGIN, DEADLINE_PASSWORD)
+OFFLINE = os.getenv("SUBMITTER_OFFLINE", "") not in ("", "0")
 
 
 class SubmitterWindow(QtWidgets.QWidget):
+    job_changed = QtCore.pyqtSignal(object, object, object)
+
     UI_FILE = os.path.join(SMBT_ROOT, "submitter.ui")
     FILE_FILTERS = "Maya (*.ma *.mb);;Maya ASCII (*.ma);;Maya Binary (*.mb);;All Files (*.*)"
 
-    JOB_STATUSES = {
-        "new": QtGui.QColor("#2d2d2d"),
-        "rendering": QtGui.QColor("#6D562E"),
-        "error": QtGui.QColor("#690000"),
-        "done": QtGui.QColor("#1F684D"),
-    }
+    JOB_STATUSES = STATUS_COLOURS
 
     @staticmethod
     def set_icon(widget, icon_name):
         widget.setIcon(QtGui.QIcon(os.path.join(ICONDIR, icon_name)))
 
-    @staticmethod
-    def get_frame_list(frames):
-        return [int(i) for i in frames.replace(
-                ",", "-").split("-") if i.isdigit()]
-
-    def __init__(self):
+    def __init__(self, offline=OFFLINE):
         super(SubmitterWindow, self).__init__()
         self.settings = QtCore.QSettings("submitter", "submitter")
 
         self.render_layers = []
         self.current_job = None
+        self.job_cache = JobCache(offline=offline)
+        self.job_watcher = JobWatcher(self.job_changed.emit)
+        self.tasks = TaskRunner(parent=self)
 
         self.configure_window()
         self.create_widgets()
@@ -66,6 +58,24 @@ class SubmitterWindow(QtWidgets.QWidget):
         self.configure_widgets()
 
         self.search_jobs()
+        self.start_job_watcher()
+
+    def start_job_watcher(self):
+        if self.job_cache.offline:
+            self.set_offline()
+            return
+        with DatabaseConnection("rendering", DBHOST, DBPORT):
+            self.job_watcher.start()
+
+    def set_offline(self):
+        """Read only mode on cached jobs, used when the database is unreachable."""
+        self.job_cache.offline = True
+        self.job_watcher.stop()
+        self.setWindowTitle("Maya Job Submitter (offline, read only)")
+        for widget in (self.ui_wgt.submitte_btn, self.ui_wgt.submitte_daily_btn,
+                       self.ui_wgt.update_job_btn, self.ui_wgt.delete_job_btn,
+                       self.ui_wgt.job_status_cbx):
+            widget.setEnabled(False)
 
     def show_message(self, icon="information", title="Submitter", text="", info=""):
         icons = {
@@ -92,8 +102,11 @@ class SubmitterWindow(QtWidgets.QWidget):
         self.ui_wgt = uic.loadUi(self.UI_FILE)
 
     def create_widgets(self):
-        groups = deadline_connection.Groups.GetGroupNames()
+        groups, fresh = deadline.cached_group_names()
         self.ui_wgt.deadline_group_cbx.addItems(groups)
+        if not fresh:
+            self.tasks.run(deadline.fetch_group_names, name="groups",
+                           on_result=self.set_groups, on_error=self.groups_failed)
         self.ui_wgt.jobs_lyt.setSpacing(3)
         self.ui_wgt.scrollArea.setWidgetResizable(True)
         self.set_icon(self.ui_wgt.search_btn, "search_solid.png")
@@ -103,22 +116,47 @@ class SubmitterWindow(QtWidgets.QWidget):
         self.set_icon(self.ui_wgt.preview_image_btn, "image_solid.png")
         self.set_icon(self.ui_wgt.submitte_daily_btn, "nuke.png")
 
+        self.job_model = JobListModel(self.fetch_job_page, runner=self.tasks, parent=self)
+        self.job_proxy = JobFilterProxyModel(self)
+        self.job_proxy.setSourceModel(self.job_model)
+        self.ui_wgt.jobs_list.setModel(self.job_proxy)
+        self.ui_wgt.jobs_list.setItemDelegate(JobStatusDelegate(self))
+        self.ui_wgt.jobs_list.setUniformItemSizes(True)
         self.ui_wgt.jobs_list.setSelectionMode(
             QtWidgets.QAbstractItemView.ExtendedSelection)
 
+        self.busy_bar = QtWidgets.QProgressBar()
+        self.busy_bar.setRange(0, 0)
+        self.busy_bar.setMaximumHeight(14)
+        self.busy_bar.setTextVisible(False)
+        self.busy_lbl = QtWidgets.QLabel()
+        # cancels the layer submit, the only task that stops part way
+        self.cancel_btn = QtWidgets.QPushButton("Cancel")
+        self.cancel_btn.hide()
+
     def create_layout(self):
         self.ui_wgt.layout().setContentsMargins(0, 0, 0, 0)
         self.ui_wgt.splitter.setStretchFactor(1, 1)
 
+        self.busy_wgt = QtWidgets.QWidget()
+        busy_lyt = QtWidgets.QHBoxLayout(self.busy_wgt)
+        busy_lyt.setContentsMargins(0, 0, 0, 0)
+        busy_lyt.addWidget(self.busy_bar)
+        busy_lyt.addWidget(self.busy_lbl)
+        busy_lyt.addWidget(self.cancel_btn)
+        self.busy_wgt.hide()
+
         self.main_layout = QtWidgets.QVBoxLayout(self)
         self.main_layout.addWidget(self.ui_wgt)
+        self.main_layout.addWidget(self.busy_wgt)
 
     def create_connections(self):
         self.ui_wgt.search_btn.clicked.connect(self.search_jobs)
-        self.ui_wgt.refresh_btn.clicked.connect(self.search_jobs)
+        self.ui_wgt.refresh_btn.clicked.connect(self.refresh_jobs)
         self.ui_wgt.search_text_led.returnPressed.connect(self.search_jobs)
+        self.ui_wgt.search_text_led.textChanged.connect(self.search_jobs)
 
-        self.ui_wgt.jobs_list.itemDoubleClicked.connect(
+        self.ui_wgt.jobs_list.doubleClicked.connect(
             self.job_double_clicked)
         self.ui_wgt.submitte_btn.clicked.connect(self.submitte)
         self.ui_wgt.submitte_daily_btn.clicked.connect(self.submite_daily)
@@ -135,6 +173,46 @@ class SubmitterWindow(QtWidgets.QWidget):
 
         self.ui_wgt.set_scene_file_btn.clicked.connect(self.set_scene_file)
 
+        self.job_changed.connect(self.job_model.apply_change)
+        self.job_model.page_loaded.connect(self.check_offline)
+        self.job_model.page_failed.connect(self.show_error)
+
+        self.tasks.busy_changed.connect(self.set_busy)
+        self.tasks.progress.connect(self.show_progress)
+        self.cancel_btn.clicked.connect(lambda: self.tasks.cancel("submit"))
+
+    def set_busy(self, busy):
+        self.busy_wgt.setVisible(busy)
+        self.busy_bar.setRange(0, 0)
+        self.busy_lbl.setText("")
+
+    def show_progress(self, done, total, message):
+        self.busy_bar.setRange(0, total)
+        self.busy_bar.setValue(done)
+        self.busy_lbl.setText(message)
+
+    def set_groups(self, groups):
+        group_cbx = self.ui_wgt.deadline_group_cbx
+        current = group_cbx.currentText()
+        group_cbx.clear()
+        group_cbx.addItems(groups)
+        if current in groups:
+            group_cbx.setCurrentText(current)
+
+    def groups_failed(self, error):
+        if not self.ui_wgt.deadline_group_cbx.count():
+            self.show_error(error, title="Deadline", text="Can't load Deadline groups.")
+
+    def show_error(self, error, title="Oops!", text="Sorry, There was an error!"):
+        self.show_message(icon="critical", title=title, text=text,
+                          info="Error:\n\n   {}".format(error))
+
+    def check_offline(self):
+        if self.job_cache.offline and self.job_watcher.is_running():
+            self.set_offline()
+            self.show_message(icon="warning", title="Offline",
+                              text="Database is unreachable, showing cached jobs read only.")
+
     def camera_list_complete(self):
         self.ui_wgt.camera_name_led.completer().complete()
 
@@ -159,26 +237,24 @@ class SubmitterWindow(QtWidgets.QWidget):
         self.settings.setValue(
             "search_string", self.ui_wgt.search_text_led.text())
 
+    def selected_job_ids(self):
+        return [index.data(JOB_ID_ROLE) for index in
+                self.ui_wgt.jobs_list.selectionModel().selectedRows()]
+
     def change_status(self, st=2):
-        items = self.ui_wgt.jobs_list.selectedItems()
-        if not items:
+        job_ids = self.selected_job_ids()
+        if not job_ids:
             return
         status = self.ui_wgt.job_status_cbx.itemText(st)
-        for item in items:
-            item.setBackground(self.JOB_STATUSES[status])
-            with DatabaseConnection("rendering", DBHOST, DBPORT):
-                job = MayaJob.objects(id=item.data(5))
-                job.update(status=status)
-
-    def update_layer(self, job_id, layer):
-        MayaJob.objects(id=job_id, render_layers__layer_name=layer["layer_name"]).update(
-            set__render_layers__S__priority=layer["priority"],
-            set__render_layers__S__frames=layer["frames"],
-            set__render_layers__S__output_directory=layer["output_directory"],
-            set__render_layers__S__comment=layer["comment"],
-            set__render_layers__S__renderable=layer["renderable"],
-            set__render_layers__S__job_id=layer["job_id"],
-        )
+        for job_id in job_ids:
+            self.job_model.set_status(job_id, status)
+
+        self.tasks.run(self._set_status, (job_ids, status), on_error=self.show_error)
+
+    @staticmethod
+    def _set_status(job_ids, status):
+        with DatabaseConnection("rendering", DBHOST, DBPORT):
+            MayaJob.objects(id__in=job_ids).update(status=status)
 
     def update_job(self, no_layers=False):
         if not self.current_job:
@@ -188,16 +264,18 @@ class SubmitterWindow(QtWidgets.QWidget):
         info = self.collect_info()
         layers = info.pop("render_layers")
 
-        with DatabaseConnection("rendering", DBHOST, DBPORT):
-            self.current_job.update(**info)
-            if no_layers:
-                return
+        def updated(result):
+            if not no_layers:
+                self.show_message(title="Updated!", text="Successfully updated job {}".format(
+                    info["batch_name"]), info="Job ID {}".format(_id))
 
-            for layer in layers:
-                self.update_layer(_id, layer)
+        self.tasks.run(self._update_job, (_id, [] if no_layers else layers, info),
+                       on_result=updated, on_error=self.show_error)
 
-        self.show_message(title="Updated!", text="Successfully updated job {}".format(
-            info["batch_name"]), info="Job ID {}".format(_id))
+    @staticmethod
+    def _update_job(job_id, layers, info):
+        with DatabaseConnection("rendering", DBHOST, DBPORT):
+            MayaJob.update_layers(job_id, layers, **info)
 
     def submitte(self):
         if not self.current_job:
@@ -207,188 +285,102 @@ class SubmitterWindow(QtWidgets.QWidget):
         info = self.collect_info()
         layers = info.pop("render_layers")
 
-        submitted_text = []
-        daily_dependencies = []
+        qc_first = self.ui_wgt.qc_first_check.isChecked()
+        submissions = [
+            layer_submission(layer, *submission_requirements(
+                info, layer, self.ui_wgt.deadline_group_cbx.currentText(),
+                self.current_job.department), qc_first=qc_first)
+            for layer in layers if layer["renderable"]]
+
+        force = self.ui_wgt.force_check.isChecked()
+        task = self.tasks.run(
+            self._submit_layers,
+            (_id, self.current_job.episode_name, submissions, layers, info, force),
+            name="submit",
+            with_task=True, on_result=self.layers_submitted, on_error=self.show_error)
+        self.cancel_btn.show()
+        # after the runner dropped the task, another submit may still run
+        task.signals.done.connect(lambda: self.cancel_btn.setVisible(self.tasks.is_busy("submit")))
+
+    @staticmethod
+    def _submit_layers(task, job_id, episode_name, submissions, layers, info, force):
+        pending = skip_unchanged(deadline, submissions, force)
         with DatabaseConnection("rendering", DBHOST, DBPORT):
-            for layer in layers:
-                if layer["renderable"]:
-                    job_info, plugin_info = self.create_submission_requiroments(
-                        info, layer)
-
-                    try:
-                        deadline_job = deadline_connection.Jobs.SubmitJob(
-                            job_info, plugin_info)
-                        layer["job_id"] = deadline_job["_id"]
-                        daily_dependencies.append(layer["job_id"])
-                        submitted_text.append(
-                            "{}".format(layer["name"]))
-                    except Exception as e:
-                        self.show_message(
-                            icon="critical", title="Oops!", text="Sorry, There was an error!", info="Error:\n\n   {}".format(str(e)))
-                        break
-                    finally:
-                        self.update_layer(_id, layer)
-                else:
-                    self.update_layer(_id, layer)
-
-        self.update_job(no_layers=True)
-        self.change_status(st=1)
-        if submitted_text:
+            apply_chunk_sizes(pending, info["batch_name"], episode_name)
+        try:
+            task.report(0, len(pending), "Submitting {}".format(info["batch_name"]))
+            finished = submit_layers(deadline, pending, cancelled=lambda: task.is_cancelled)
+            for n, submission in enumerate(finished, 1):
+                task.report(n, len(pending), "Submitted {}".format(submission.name))
+        finally:
+            # a job whose layers were all reused keeps its status
+            fields = dict(info, status="rendering") if pending else info
+            with DatabaseConnection("rendering", DBHOST, DBPORT):
+                MayaJob.update_layers(job_id, layers, **fields)
+        return job_id, info, submissions, layers
+
+    def layers_submitted(self, result):
+        job_id, info, submissions, layers = result
+        if self.current_job and self.current_job.id == job_id:
+            # the layer widgets read these on the next submit or update
+            store_submitted(self.current_job.render_layers, layers)
+        submitted = [s for s in submissions if s.ok]
+        failed = [s for s in submissions if not s.ok]
+        if failed:
+            self.show_message(
+                icon="critical", title="Oops!",
+                text="{} of {} layers failed to submit!".format(len(failed), len(submissions)),
+                info="\n".join("{}:\n   {}".format(s.name, s.error) for s in failed))
+        if submitted:
+            saved = sum(s.load_saved for s in submitted)
             self.show_message(title="Success!", text="Successfully submitted job {}".format(
-                info["batch_name"]), info="   \n".join(submitted_text))
-        self.submite_daily(daily_dependencies, msg=False)
-        self.search_jobs()
-
-    def create_submission_requiroments(self, info, layer):
-        job_info = {
-            "BatchName": info["batch_name"],
-            "Group": self.ui_wgt.deadline_group_cbx.currentText(),
-            "Department": self.current_job.department,
-            "Frames": layer["frames"],
-            "Name": layer["name"],
-            "Priority": layer["priority"],
-            "OutputDirectory0": layer["output_directory"],
-            "OutputFilename0": layer["output_filename"],
-            "Comment": layer["comment"],
-            "EnvironmentKeyValue0": "MAYA_MODULE_PATH=\\\\dell\\StudioRepository\\twa_pipeline\\render",
-            "OverrideTaskExtraInfoNames": "False",
-            "Plugin": "MayaBatch",
-            "UserName": "admin",
-            "ChunkSize": "1",
-        }
-
-        plugin_info = {
-            "Animation": 1,
-            "Build": "64bit",
-            "Camera": info["camera_name"],
-            "SceneFile": info["scene_file"],
-            "OutputFilePath": layer["output_directory"],
-            "RenderLayer": layer["layer_name"],
-            "FrameNumberOffset": 0,
-            "IgnoreError211": 0,
-            "ImageHeight": 1080,
-            "ImageWidth": 1920,
-            "OutputFilePrefix": "<Scene>_<Layer>",
-            "RenderSetupIncludeLights": "1",
-            "Renderer": "vray",
-            "StrictErrorChecking": "0",
-            "UseLegacyRenderLayers": "1",
-            "UseLocalAssetCaching": "0",
-            "UsingRenderLayers": "1",
-            "VRayAutoMemoryBuffer": "500",
-            "VRayAutoMemoryEnabled": "0",
-            "Version": "2020",
-        }
-
-        return (job_info, plugin_info)
+                info["batch_name"]), info="   \n".join(
+                    "{} ({})".format(s.name, s.skipped or "chunk {}".format(s.job_info["ChunkSize"]))
+                    for s in submitted) +
+                "\n\nScene loading saved ~{:.0f} min".format(saved / 60.0))
+        if submitted and all(s.skipped == "unchanged" for s in submitted):
+            # nothing new on the farm, the daily is up to date too
+            return
+        self.job_model.set_status(job_id, "rendering")
+        if self.current_job and self.current_job.id == job_id:
+            self.submite_daily(submitted, msg=False)
 
-    def submite_daily(self, dependencies=None, msg=True):
-        if self.current_job["has_daily"] and deadline_connection.Jobs.GetJob(self.current_job["daily"]):
-            deadline_connection.Jobs.RequeueJob(self.current_job["daily"])
+    def submite_daily(self, submitted=None, msg=True):
+        if not self.current_job:
             return
 
         info = self.info_for_daily()
-        if dependencies:
-            info["dependencies"] = dependencies
-        job_info, plugin_info = self.create_daily_requiroments(info)
+        if submitted:
+            daily_dependencies(info, submitted)
 
-        try:
-            daily_job = deadline_connection.Jobs.SubmitJob(
-                job_info, plugin_info)
+        def submitted(result):
+            if msg and result == "submitted":
+                self.show_message(
+                    title="Success!", text="Successfully submitted daily for {}".format(info["batch_name"]))
 
-            with DatabaseConnection("rendering", DBHOST, DBPORT):
-                self.current_job.update(daily=daily_job["_id"], has_daily=True)
-        except Exception as e:
-            self.show_message(
-                icon="critical", title="Oops! Problem with Daily!", text="Sorry, Daily was not submitted properly!", info="Error:\n\n   {}".format(str(e)))
-            return
+        def failed(error):
+            self.show_error(error, title="Oops! Problem with Daily!",
+                            text="Sorry, Daily was not submitted properly!")
 
-        if msg:
-            self.show_message(
-                title="Success!", text="Successfully submitted daily for {}".format(info["batch_name"]))
+        frame_dependent = self.ui_wgt.frame_daily_check.isChecked()
+        self.tasks.run(self._submit_daily, (self.current_job, info, frame_dependent),
+                       name="daily", on_result=submitted, on_error=failed)
 
-    def create_daily_requiroments(self, info):
-        dependencies = info["dependencies"]
-        if None in dependencies:
-            self.show_message(
-                icon="warning", text="You need to submitte job to be able to create dailiy.")
-            return
+    @staticmethod
+    def _submit_daily(job, info, frame_dependent):
+        if requeue_daily(deadline, job):
+            return "requeued"
 
-        scene_file, output_filename = nuke_dailies.build_daily(info)
-        output_filename = output_filename.replace("Render_scenes", "Render")
-        job_info = {
-            "BatchName": info["batch_name"],
-            "Name": "{} - Daily".format(info["batch_name"]),
-            "ChunkSize": "1000",
-            "Department": "lighting",
-            "EventOptIns": "",
-            "Frames": info["frames"],
-            "OutputFilename0": output_filename,
-            "Group": "nuke",
-            "OverrideTaskExtraInfoNames": "False",
-            "Plugin": "Nuke",
-            "Priority": "80",
-            "UserName": "admin",
-        }
-        for n, d in enumerate(dependencies):
-            job_info["JobDependency{}".format(n)] = d
-        plugin_info = {
-            "BatchMode": "True",
-            "BatchModeIsMovie": "True",
-            "ContinueOnError": "True",
-            "EnforceRenderOrder": "False",
-            "GpuOverride": "0",
-            "NukeX": "True",
-            "PerformanceProfiler": "False",
-            "RamUse": "0",
-            "RenderMode": "Use Scene Settings",
-            "SceneFile": scene_file,
-            "StackSize": "0",
-            "Threads": "0",
-            "UseGpu": "False",
-            "Version": "11.3",
-            "Views": "",
-            "WriteNode": "COMP_OUT",
-        }
-        return (job_info, plugin_info)
+        daily = DailySubmission(info, frame_dependent).submit(deadline)
+        if not daily.ok:
+            raise daily.error
+        with DatabaseConnection("rendering", DBHOST, DBPORT):
+            job.update(**daily.fields())
+        return "submitted"
 
     def info_for_daily(self):
         info = self.collect_info()
-        layers = info.pop("render_layers")
-        render_layers = dict()
-        frames_list = []
-        dependencies = []
-        for layer in layers:
-            frame_list = self.get_frame_list(layer["frames"])
-            frames_list.append([frame_list[0], frame_list[-1]])
-            dependencies.append(layer["job_id"])
-            scene_name = os.path.split(
-                os.path.dirname(layer["output_directory"]))[-1]
-            layer_name = layer["layer_name"]
-            write_name = layer["layer_name"]
-
-            if layer_name == "FLOOR_AO":
-                for fp in ["AO_Pass", "matteShadow"]:
-                    write_name = fp
-                    output_filename = "{}_{}.{}.####.exr".format(
-                        scene_name, layer_name, fp)
-                    output_filename = os.path.join(
-                        layer["output_directory"], fp, output_filename)
-                    render_layers[write_name] = output_filename
-            else:
-                output_filename = "{}_{}.####.exr".format(
-                    scene_name, layer_name)
-                output_filename = os.path.join(
-                    layer["output_directory"], output_filename)
-                render_layers[write_name] = output_filename
-
-        info["frames"] = "{}-{}".format(min([min(x) for x in frames_list]),
-                                        max([max(x) for x in frames_list]))
-        info["render_layers"] = render_layers
-        info["dependencies"] = dependencies
-        info["render_dir"] = os.path.dirname(
-            info["scene_file"].replace(RENDER_SCENES, RENDERS))
-        return info
+        return daily_info(info, info.pop("render_layers"))
 
     def collect_info(self):
         return {
@@ -425,32 +417,32 @@ class SubmitterWindow(QtWidgets.QWidget):
         self.ui_wgt.camera_name_led.setText(camera_name)
 
     def search_jobs(self):
-        QtCore.QCoreApplication.processEvents()
+        status = "new" if self.ui_wgt.new_jobs_check.isChecked() else None
+        query = JobQuery(self.ui_wgt.search_text_led.text(), status)
 
-        search_text = self.ui_wgt.search_text_led.text()
-        with DatabaseConnection("rendering", DBHOST, DBPORT):
-            jobs = MayaJob.objects().order_by("batch_name")
-
-        if search_text:
-            jobs = jobs(batch_name__icontains=search_text)
+        self.job_proxy.set_query(query)
+        if self.job_model.exhausted and query.narrows(self.job_model.query):
+            # every job of the loaded query is here, filter locally
+            return
 
-        if self.ui_wgt.new_jobs_check.isChecked():
-            jobs = jobs(status__exact="new")
+        self.job_model.set_query(query)
+        self.job_model.fetchMore()
 
-        self.populate_jobs(jobs)
+    def refresh_jobs(self):
+        self.job_model.set_query(self.job_model.query)
+        self.search_jobs()
 
-    def populate_jobs(self, jobs=None):
-        self.ui_wgt.jobs_list.clear()
+    def fetch_job_page(self, query, after, limit):
+        # runs on a worker thread, check_offline reports the switch
+        if not self.job_cache.offline:
+            try:
+                with DatabaseConnection("rendering", DBHOST, DBPORT):
+                    return MayaJob.summaries(query.search_text, query.status, after, limit)
+            except OFFLINE_ERRORS:
+                self.job_cache.offline = True
 
-        if not jobs:
-            return
-
-        for job in jobs:
-            item = QtWidgets.QListWidgetItem(job.batch_name)
-            item.setData(5, job.id)
-            item.setSizeHint(QtCore.QSize(25, 25))
-            item.setBackground(self.JOB_STATUSES[job.status])
-            self.ui_wgt.jobs_list.addItem(item)
+        # the cache is small, it comes as one page
+        return [] if after else self.job_cache.summaries(query.search_text, query.status)
 
     def clear_render_layers(self):
         self.render_layers = []
@@ -467,41 +459,61 @@ class SubmitterWindow(QtWidgets.QWidget):
         self.ui_wgt.camera_name_led.setText(""),
 
     def delete_job(self):
-        item = self.ui_wgt.jobs_list.currentItem()
-        items = self.ui_wgt.jobs_list.selectedItems()
-        if not items:
+        job_ids = self.selected_job_ids()
+        if not job_ids:
             return
-        with DatabaseConnection("rendering", DBHOST, DBPORT):
-            for item in items:
-                job_id = item.data(5)
-                if self.current_job and job_id == self.current_job.id:
-                    self.clear_job_wgts()
+        if self.current_job and self.current_job.id in job_ids:
+            self.clear_job_wgts()
 
-                job = MayaJob.objects(id=job_id)
-                job.delete()
+        def deleted(result):
+            for job_id in job_ids:
+                self.job_model.remove_job(job_id)
 
-        self.search_jobs()
+        self.tasks.run(self._delete_jobs, (job_ids,), on_result=deleted, on_error=self.show_error)
+
+    @staticmethod
+    def _delete_jobs(job_ids):
+        with DatabaseConnection("rendering", DBHOST, DBPORT):
+            MayaJob.objects(id__in=job_ids).delete()
 
     def show_preview(self):
         if not self.current_job:
             return
 
-        preview = os.path.abspath(self.current_job.scene_preview)
+        def checked(found):
+            if not found:
+                self.show_message(title="No Preview",
+                                  icon="warning", text="Can't find preview.")
+
+        self.tasks.run(self._open_preview, (self.current_job,),
+                       on_result=checked, on_error=self.show_error)
+
+    @staticmethod
+    def _open_preview(job):
+        preview = os.path.abspath(job.scene_preview)
         if os.path.isfile(preview):
-            subprocess.call("explorer {}".format(preview))
-        else:
-            self.show_message(title="No Preview",
-                              icon="warning", text="Can't find preview.")
-            with DatabaseConnection("rendering", DBHOST, DBPORT):
-                self.current_job.update(scene_preview="")
+            subprocess.Popen("explorer {}".format(preview))
+            return True
+
+        with DatabaseConnection("rendering", DBHOST, DBPORT):
+            job.update(scene_preview="")
+        return False
 
     def job_double_clicked(self):
-        self.clear_render_layers()
+        _id = self.ui_wgt.jobs_list.currentIndex().data(JOB_ID_ROLE)
+        self.tasks.run(self._load_job, (_id,), name="load_job", replace=True,
+                       on_result=self.show_job, on_error=self.show_error)
 
-        _id = self.ui_wgt.jobs_list.currentItem().data(5)
+    def _load_job(self, job_id):
         with DatabaseConnection("rendering", DBHOST, DBPORT):
-            job = MayaJob.objects(id=_id).first()
+            return self.job_cache.get(job_id)
+
+    def show_job(self, job):
+        self.check_offline()
+        if not job:
+            return
 
+        self.clear_render_layers()
         self.current_job = job
         for layer in self.current_job.render_layers:
             lyr_wgt = JobRenderLayer(layer)
@@ -510,6 +522,21 @@ class SubmitterWindow(QtWidgets.QWidget):
 
         self.configure_widgets()
 
+        if not self.job_cache.offline:
+            self.tasks.run(
+                self._layer_estimates,
+                ([l.layer_name for l in job.render_layers], job.batch_name, job.episode_name),
+                name="estimates", replace=True, on_result=self.show_estimates)
+
+    @staticmethod
+    def _layer_estimates(layer_names, batch_name, episode_name):
+        with DatabaseConnection("rendering", DBHOST, DBPORT):
+            return RenderStat.estimates(layer_names, batch_name, episode_name)
+
+    def show_estimates(self, estimates):
+        for lyr_wgt in self.render_layers:
+            lyr_wgt.set_estimate(*estimates.get(lyr_wgt.layer.layer_name, (None, None)))
+
     def set_scene_file(self):
         if self.current_job:
             file_path, _ = QtWidgets.QFileDialog.getOpenFileName(
@@ -520,6 +547,9 @@ class SubmitterWindow(QtWidgets.QWidget):
     def closeEvent(self, e):
         super(SubmitterWindow, self).closeEvent(e)
 
+        self.job_watcher.stop()
+        self.tasks.cancel()
+        self.tasks.wait(5000)
         self.save_settings()
 
 
@@ -532,6 +562,8 @@ class JobRenderLayer(QtWidgets.QWidget):
 
         self._layer = layer
         self.layer_name = self.layer.name()
+        self.frame_time = None
+        self.load_time = None
 
         self.create_widgets()
         self.create_layout()
@@ -557,6 +589,8 @@ class JobRenderLayer(QtWidgets.QWidget):
         layer_info["comment"] = self.lyr_wgt.commentLineEdit.text()
         layer_info["priority"] = self.lyr_wgt.prioritySpinBox.value()
         layer_info["job_id"] = self.layer.job_id
+        layer_info["qc_job_id"] = self.layer.qc_job_id
+        layer_info["submission_hash"] = self.layer.submission_hash
         if self.lyr_wgt.qcCheck.isChecked():
             layer_info["frames"] = frame_list(
                 str(self.lyr_wgt.framesLineEdit.text()))
@@ -574,6 +608,9 @@ class JobRenderLayer(QtWidgets.QWidget):
         self.lyr_wgt.prioritySpinBox.setValue(self.layer.priority)
         self.lyr_wgt.renderableCheck.setChecked(self.layer.renderable)
 
+        self.eta_lbl = QtWidgets.QLabel("-")
+        self.lyr_wgt.formLayout.addRow("ETA", self.eta_lbl)
+
     def create_layout(self):
         self.lyr_wgt.layout().setContentsMargins(0, 0, 0, 0)
         self.main_layout = QtWidgets.QVBoxLayout(self)
@@ -581,6 +618,26 @@ class JobRenderLayer(QtWidgets.QWidget):
 
     def create_connections(self):
         self.lyr_wgt.set_dir_btn.clicked.connect(self.set_output_dir)
+        self.lyr_wgt.framesLineEdit.textChanged.connect(self.update_eta)
+
+    def set_estimate(self, frame_time, load_time):
+        self.frame_time = frame_time
+        self.load_time = load_time
+        self.update_eta()
+
+    def update_eta(self):
+        if self.frame_time is None:
+            self.eta_lbl.setText("no render history")
+            return
+        try:
+            frame_count = len(FrameSet.parse(str(self.lyr_wgt.framesLineEdit.text())))
+        except ValueError:
+            self.eta_lbl.setText("-")
+            return
+        chunk_size = adaptive_chunk_size(self.frame_time, self.load_time, frame_count)
+        eta = RenderStat.eta(frame_count, self.frame_time, self.load_time, chunk_size)
+        self.eta_lbl.setText("~{} farm time, {} per frame, chunk {}".format(
+            format_duration(eta), format_duration(self.frame_time), chunk_size))
 
     def set_output_dir(self):
         directory = QtWidgets.QFileDialog.getExistingDirectory(
@@ -594,6 +651,16 @@ class JobRenderLayer(QtWidgets.QWidget):
         self.deleteLater()
 
 
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return "{}h {:02d}m".format(hours, minutes)
+    if minutes:
+        return "{}m {:02d}s".format(minutes, seconds)
+    return "{}s".format(seconds)
+
+
 def dark_theme():
     dark_palette = QtGui.QPalette()
     dark_palette.setColor(QtGui.QPalette.Window, QtGui.QColor(45, 45, 45))
@@ -624,7 +691,7 @@ if __name__ == "__main__":
 
     app.setPalette(dark_theme())
 
-    window = SubmitterWindow()
+    window = SubmitterWindow(offline=OFFLINE or "--offline" in sys.argv)
     window.show()
 
     app.exec_()
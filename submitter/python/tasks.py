@@ -0,0 +1,126 @@
+"""
+Small QThreadPool task framework, keeps database and farm calls off the
+GUI thread.
+
+    runner = TaskRunner()
+    runner.run(fetch_jobs, args=(query,), on_result=self.populate, name="search")
+
+Results, errors and progress come back as queued signals, so the callbacks
+run on the GUI thread. Functions started with with_task=True get the Task
+as first argument to report progress and check for cancellation. A task
+cancelled before it started never calls its function; once started the
+function decides what cancelling means, its result is always reported.
+"""
+import threading
+
+from PyQt5 import QtCore
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class TaskSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int, int, str)
+    finished = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(object)
+    cancelled = QtCore.pyqtSignal()
+    done = QtCore.pyqtSignal()
+
+
+class Task(QtCore.QRunnable):
+
+    def __init__(self, func, args=(), kwargs=None, name=None, with_task=False):
+        super(Task, self).__init__()
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.name = name
+        self.with_task = with_task
+        self.signals = TaskSignals()
+        self._cancel = threading.Event()
+        # the runner keeps the reference, don't let Qt delete it under us
+        self.setAutoDelete(False)
+
+    @property
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self.is_cancelled:
+            raise TaskCancelled()
+
+    def report(self, done, total, message=""):
+        self.signals.progress.emit(done, total, message)
+
+    def run(self):
+        try:
+            self.check_cancelled()
+            args = (self,) + tuple(self.args) if self.with_task else self.args
+            result = self.func(*args, **self.kwargs)
+        except TaskCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
+        finally:
+            self.signals.done.emit()
+
+
+class TaskRunner(QtCore.QObject):
+    """Starts Tasks on a thread pool and tracks which ones are still running."""
+
+    busy_changed = QtCore.pyqtSignal(bool)
+    progress = QtCore.pyqtSignal(int, int, str)
+
+    def __init__(self, max_threads=4, parent=None):
+        super(TaskRunner, self).__init__(parent)
+        self.pool = QtCore.QThreadPool()
+        self.pool.setMaxThreadCount(max_threads)
+        self._tasks = []
+
+    def run(self, func, args=(), kwargs=None, name=None, with_task=False,
+            on_result=None, on_error=None, on_progress=None, replace=False):
+        """
+        Run func(*args, **kwargs) on the pool and return its Task.
+        With replace, running tasks of the same name are cancelled first.
+        """
+        if replace and name:
+            self.cancel(name)
+
+        task = Task(func, args, kwargs, name=name, with_task=with_task)
+        if on_result:
+            task.signals.finished.connect(on_result)
+        if on_error:
+            task.signals.failed.connect(on_error)
+        if on_progress:
+            task.signals.progress.connect(on_progress)
+        task.signals.progress.connect(self.progress)
+        task.signals.done.connect(lambda: self._task_done(task))
+
+        self._tasks.append(task)
+        if len(self._tasks) == 1:
+            self.busy_changed.emit(True)
+        self.pool.start(task)
+        return task
+
+    def cancel(self, name=None):
+        for task in self._tasks:
+            if name is None or task.name == name:
+                task.cancel()
+
+    def is_busy(self, name=None):
+        return any(name is None or t.name == name for t in self._tasks)
+
+    def wait(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+    def _task_done(self, task):
+        if task in self._tasks:
+            self._tasks.remove(task)
+        if not self._tasks:
+            self.busy_changed.emit(False)
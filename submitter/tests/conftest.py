@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the rez packages put these on PYTHONPATH
+for path in (
+        os.path.join(ROOT, "submitter", "python"),
+        os.path.join(ROOT, "main", "resources", "python")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+TEST_DB_HOST = os.getenv("TEST_DB_HOST", "localhost")
+TEST_DB_PORT = int(os.getenv("TEST_DB_PORT", 27017))
+TEST_DB_NAME = "rendering_test"
+
+
+@pytest.fixture
+def database():
+    """
+    Empty TEST_DB_NAME on the mongod at TEST_DB_HOST / TEST_DB_PORT
+    (default localhost:27017) as the default alias, yields the ismaster
+    reply. Skipped when no mongod answers.
+    """
+    pytest.importorskip("mongoengine")
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+    from mongo_connection import registry
+    from mongo_documents import DatabaseConnection
+
+    client = MongoClient(TEST_DB_HOST, TEST_DB_PORT, serverSelectionTimeoutMS=1000)
+    try:
+        hello = client.admin.command("ismaster")
+    except PyMongoError:
+        pytest.skip("no mongod on {}:{}".format(TEST_DB_HOST, TEST_DB_PORT))
+    client.drop_database(TEST_DB_NAME)
+    with DatabaseConnection(TEST_DB_NAME, TEST_DB_HOST, TEST_DB_PORT):
+        yield hello
+    registry.disconnect()
+    client.drop_database(TEST_DB_NAME)
+    client.close()
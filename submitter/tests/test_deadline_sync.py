@@ -0,0 +1,90 @@
+"""DeadlineSync against the local fake of the Deadline web service."""
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("mongoengine")
+
+import fake_deadline
+from fake_deadline import FakeDeadline, serve
+from deadline_sync import DeadlineSync, DELETED
+
+
+def layer(name, job_id, **values):
+    return dict(values, layer_name=name, job_id=job_id)
+
+
+@pytest.fixture
+def fake():
+    fake = FakeDeadline(load_time=30, frame_time=20)
+    fake.add_job("rendering", tasks=10, completed=4, rendering=2)
+    fake.add_job("queued", tasks=10)
+    fake.add_job("done", stat=fake_deadline.COMPLETED, tasks=10, completed=10, Frames="1-10")
+    fake.add_job("qc", stat=fake_deadline.FAILED, tasks=5, failed=1)
+    fake.add_job("fill", stat=fake_deadline.PENDING, tasks=10)
+    return fake
+
+
+def test_fetch_batches_over_http(fake):
+    pytest.importorskip("Deadline.DeadlineConnect")
+    from deadline_client import DeadlineClient
+
+    server, fake = serve(fake)
+    try:
+        syncer = DeadlineSync(DeadlineClient("localhost", server.server_port), batch_size=2)
+        farm_jobs = syncer.fetch(["rendering", "queued", "done", "qc", "fill", "gone"])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert sorted(farm_jobs) == ["done", "fill", "qc", "queued", "rendering"]
+    assert syncer.requests == 3
+    assert len([r for r in fake.requests if r[1] == "/api/jobs"]) == 3
+
+
+def test_updates(fake):
+    documents = [
+        {"_id": 1, "status": "rendering", "render_layers": [
+            layer("BG", "rendering", status="queued", progress=0.0),
+            layer("CHAR", "done", status="rendering", progress=50.0),
+            layer("FX", None),
+        ]},
+        {"_id": 2, "status": "rendering", "render_layers": [
+            layer("BG", "fill", qc_job_id="qc", status="queued", progress=0.0),
+        ]},
+        {"_id": 3, "status": "rendering", "daily": "gone", "render_layers": [
+            layer("BG", "queued", status="queued", progress=0.0),
+        ]},
+    ]
+    syncer = DeadlineSync(fake)
+    requests, finished, cancel = syncer.updates(documents, dict(fake.jobs))
+
+    by_id = dict((r._filter["_id"], r) for r in requests)
+    assert sorted(by_id) == [1, 2, 3]
+
+    first = by_id[1]
+    values = first._doc["$set"]
+    assert values["render_layers.0.status"] == "rendering"
+    assert values["render_layers.0.progress"] == 40.0
+    assert values["render_layers.1.status"] == "done"
+    assert values["render_layers.1.progress"] == 100.0
+    assert "render_layers.2.status" not in values
+    assert first._filter["render_layers.0.job_id"] == "rendering"
+    assert first._filter["render_layers.1.layer_name"] == "CHAR"
+    assert first._filter["render_layers.1.job_id"] == "done"
+    assert [l["job_id"] for _, l in finished] == ["done"]
+
+    # the failed QC job fails the layer and stops its waiting fill job
+    assert by_id[2]._doc["$set"]["render_layers.0.status"] == "error"
+    assert by_id[2]._doc["$set"]["status"] == "error"
+    assert cancel == ["fill"]
+
+    # nothing changed on the layer, only the daily is gone
+    assert by_id[3]._doc["$set"]["daily_status"] == DELETED
+    assert "render_layers.0.status" not in by_id[3]._doc["$set"]
+
+
+def test_updates_without_changes(fake):
+    documents = [{"_id": 1, "status": "done", "render_layers": [
+        layer("BG", "done", status="done", progress=100.0)]}]
+    requests, finished, cancel = DeadlineSync(fake).updates(documents, dict(fake.jobs))
+    assert (requests, finished, cancel) == ([], [], [])
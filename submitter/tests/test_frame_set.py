@@ -0,0 +1,79 @@
+import pytest
+
+from frame_set import FrameSet, listed_in_order
+
+
+def test_parse_and_serialize():
+    frames = FrameSet.parse("101-120, 121, 140-200x10")
+    assert frames.to_deadline() == "101-121,140-200x10"
+    assert str(FrameSet.parse("-3--1,5")) == "-3--1,5"
+    assert FrameSet.parse("1-10x3").to_deadline() == "1-10x3"
+    assert list(FrameSet.parse("1-10x3")) == [1, 4, 7, 10]
+    assert FrameSet.parse("") == FrameSet()
+    assert FrameSet.parse(FrameSet.parse("1-5,9").to_deadline()) == FrameSet.parse("1-5,9")
+
+
+def test_parse_rejects_garbage():
+    with pytest.raises(ValueError):
+        FrameSet.parse("1-a")
+
+
+def test_from_frames_compresses():
+    frames = FrameSet.from_frames([5, 1, 2, 3, 3, 10, 20, 30])
+    assert frames.to_deadline() == "1-3,5,10-30x10"
+    assert len(frames) == 7
+    assert (frames.first, frames.last) == (1, 30)
+
+
+def test_indexing_and_membership():
+    frames = FrameSet.parse("1-5,10-20x5")
+    assert frames[0] == 1
+    assert frames[5] == 10
+    assert frames[-1] == 20
+    assert frames[1:7] == [2, 3, 4, 5, 10, 15]
+    assert 15 in frames
+    assert 12 not in frames
+
+
+def test_set_operations():
+    a = FrameSet.parse("1-10")
+    b = FrameSet.parse("5-15")
+    assert (a | b).to_deadline() == "1-15"
+    assert (a & b).to_deadline() == "5-10"
+    assert (a - b).to_deadline() == "1-4"
+    assert (a & FrameSet.parse("2-10x2")).to_deadline() == "2-10x2"
+    assert FrameSet.parse("1-10") | FrameSet.parse("11-20") == FrameSet.parse("1-20")
+    assert not FrameSet.parse("1-5") - FrameSet.parse("1-10")
+
+
+def test_chunks_and_slice():
+    frames = FrameSet.parse("1-10,20")
+    assert [c.to_deadline() for c in frames.chunks(4)] == ["1-4", "5-8", "9-10,20"]
+    assert frames.slice(8, 20).to_deadline() == "9-10,20"
+
+
+def test_qc_order():
+    frames = FrameSet.parse("1-9")
+    order = list(frames.qc_order())
+    assert order[:3] == [1, 9, 5]
+    assert sorted(order) == list(frames)
+
+
+def test_qc_deadline_list_has_every_frame_once():
+    assert FrameSet.parse("1-100").to_deadline(qc=True) == \
+        "1,100,65,33-97x64,17-81x32,9-89x16,5-93x8,3-99x4,2-98x2"
+    for frames in ("1-100", "1-2", "7", "1-10,20-40x2", "1001-1240"):
+        frames = FrameSet.parse(frames)
+        qc = FrameSet.parse(frames.to_deadline(qc=True))
+        listed = [f for token in frames.to_deadline(qc=True).split(",")
+                  for f in FrameSet.parse(token)]
+        assert qc == frames
+        assert len(listed) == len(frames)
+
+
+def test_listed_in_order():
+    assert listed_in_order("1-10,12,20-40x5")
+    assert listed_in_order("")
+    assert not listed_in_order(FrameSet.parse("1-100").to_deadline(qc=True))
+    assert not listed_in_order("1-9x2,2-10x2")
+    assert not listed_in_order("1-10,10")
@@ -0,0 +1,81 @@
+"""
+JobWatcher against a real mongod, see the database fixture. The change
+stream test needs a single node replica set:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 & mongo --eval "rs.initiate()"
+"""
+import time
+import datetime
+
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("mongoengine")
+
+from mongo_documents import MayaJob
+from job_watcher import JobWatcher
+
+
+def wait_for(condition, timeout=10.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def watch(use_change_streams):
+    changes = []
+    watcher = JobWatcher(lambda *change: changes.append(change), poll_interval=0.1,
+                         use_change_streams=use_change_streams)
+    watcher.start()
+    return watcher, changes
+
+
+def test_polling(database):
+    collection = MayaJob._get_collection()
+    stamp = datetime.datetime(2030, 1, 1)
+    existing = collection.insert_one({"batch_name": "sc_0001", "status": "new", "date_updated": stamp}).inserted_id
+
+    watcher, changes = watch(use_change_streams=False)
+    try:
+        assert wait_for(lambda: watcher.mode == "polling")
+        time.sleep(0.3)
+        # same millisecond as the cursor, only the new job is reported
+        same_ms = collection.insert_one(
+            {"batch_name": "sc_0002", "status": "new", "date_updated": stamp}).inserted_id
+        assert wait_for(lambda: changes)
+        time.sleep(0.3)
+        assert changes == [("insert", same_ms, {
+            "batch_name": "sc_0002", "status": "new", "date_updated": stamp})]
+
+        later = stamp + datetime.timedelta(seconds=1)
+        collection.update_one({"_id": existing}, {"$set": {"status": "rendering", "date_updated": later}})
+        assert wait_for(lambda: len(changes) == 2)
+        assert changes[1] == ("update", existing, {
+            "batch_name": "sc_0001", "status": "rendering", "date_updated": later})
+
+        collection.delete_one({"_id": same_ms})
+        assert wait_for(lambda: len(changes) == 3)
+        assert changes[2] == ("delete", same_ms, None)
+        time.sleep(0.3)
+        assert len(changes) == 3
+    finally:
+        watcher.stop(5)
+
+
+def test_change_stream(database):
+    if not database.get("setName"):
+        pytest.skip("change streams need a replica set")
+    watcher, changes = watch(use_change_streams=True)
+    try:
+        assert wait_for(lambda: watcher.mode == "change_stream")
+        time.sleep(0.5)
+        job = MayaJob(batch_name="sc_0001")
+        job.save()
+        assert wait_for(lambda: changes)
+        assert changes[0][:2] == ("insert", job.id)
+        assert changes[0][2]["batch_name"] == "sc_0001"
+    finally:
+        watcher.stop(5)
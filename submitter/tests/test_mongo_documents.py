@@ -0,0 +1,26 @@
+"""MayaJob queries against a real mongod, see the database fixture."""
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("mongoengine")
+
+from mongo_documents import MayaJob
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_summaries_pages(database, limit):
+    collection = MayaJob._get_collection()
+    collection.insert_many([{"status": "new"} for _ in range(2)] + [
+        {"batch_name": name, "status": "new"} for name in ("", "", "sc_0001", "sc_0002", "sc_0002")])
+    expected = MayaJob.summaries()
+    assert [s[1] for s in expected] == [None, None, "", "", "sc_0001", "sc_0002", "sc_0002"]
+
+    pages = []
+    after = None
+    while True:
+        page = MayaJob.summaries(after=after, limit=limit)
+        pages += page
+        if len(page) < limit:
+            break
+        after = (page[-1][1], page[-1][0])
+    assert pages == expected
@@ -0,0 +1,97 @@
+"""Layer submissions against the in process fake of the Deadline service."""
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("mongoengine")
+
+from fake_deadline import FakeDeadline
+from frame_set import FrameSet
+from mongo_documents import MayaJob, MayaRenderLayer
+from submission import (
+    layer_submission, skip_unchanged, submit_layers, submission_requirements,
+    collect_job_info, store_submitted, frame_dependencies)
+
+
+class FakeJobs(object):
+    """DeadlineCon.Jobs calls answered by FakeDeadline.handle()."""
+
+    def __init__(self, fake):
+        self.fake = fake
+
+    def SubmitJob(self, job_info, plugin_info):
+        return self.fake.handle("POST", "/api/jobs", {}, {
+            "JobInfo": job_info, "PluginInfo": plugin_info, "IdOnly": True})[1]
+
+    def GetJobs(self, ids):
+        return self.fake.handle("GET", "/api/jobs", {"JobID": [",".join(ids)]}, None)[1]
+
+
+class FakeConnection(object):
+
+    def __init__(self, fake):
+        self.Jobs = FakeJobs(fake)
+
+
+def maya_job():
+    return MayaJob(
+        batch_name="sc_0001", scene_file="sc_0001.ma", camera_name="cam",
+        render_layers=[
+            MayaRenderLayer(layer_name=name, batch_name="sc_0001", frames="1-20",
+                            output_directory="out", output_filename="sc_0001_" + name)
+            for name in ("BG", "CHAR")])
+
+
+def submit(connection, job, qc_first=False):
+    info = collect_job_info(job)
+    layers = info.pop("render_layers")
+    submissions = [
+        layer_submission(layer, *submission_requirements(info, layer, "vray"), qc_first=qc_first)
+        for layer in layers]
+    pending = skip_unchanged(connection, submissions)
+    list(submit_layers(connection, pending))
+    store_submitted(job.render_layers, layers)
+    return submissions, pending
+
+
+@pytest.mark.parametrize("qc_first", [False, True])
+def test_second_submit_skips_unchanged_layers(qc_first):
+    fake = FakeDeadline()
+    connection = FakeConnection(fake)
+    job = maya_job()
+
+    submissions, pending = submit(connection, job, qc_first)
+    assert len(pending) == 2
+    assert all(s.ok for s in submissions)
+    assert [l.job_id for l in job.render_layers] == [s.job_id for s in submissions]
+    assert [l.submission_hash for l in job.render_layers] == [s.submission_hash for s in submissions]
+    jobs = len(fake.jobs)
+
+    submissions, pending = submit(connection, job, qc_first)
+    assert pending == []
+    assert [s.skipped for s in submissions] == ["unchanged", "unchanged"]
+    assert len(fake.jobs) == jobs
+
+
+def test_changed_layer_is_submitted_again():
+    fake = FakeDeadline()
+    connection = FakeConnection(fake)
+    job = maya_job()
+    submit(connection, job)
+    first_ids = [l.job_id for l in job.render_layers]
+
+    job.render_layers[1].frames = "1-30"
+    submissions, pending = submit(connection, job)
+    assert [s.layer["layer_name"] for s in pending] == ["CHAR"]
+    assert job.render_layers[0].job_id == first_ids[0]
+    assert job.render_layers[1].job_id != first_ids[1]
+
+
+def test_frame_dependencies_cover_every_daily_frame():
+    frames = FrameSet.parse("1-20")
+    layers = [
+        {"job_id": "plain", "frames": "1-20"},
+        {"job_id": "fill", "qc_job_id": "qc", "frames": "1-20"},
+        {"job_id": "bg", "frames": "1"},
+        {"job_id": "longer", "frames": "1-30"},
+    ]
+    assert frame_dependencies(frames, layers) == ["plain", "longer"]
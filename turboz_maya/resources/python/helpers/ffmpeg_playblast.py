@@ -1,6 +1,8 @@
 import os
 import sys
 import copy
+import time
+import ctypes
 import tempfile
 import traceback
 import datetime
@@ -12,6 +14,9 @@ from Qt import (
 
 import pymel.core as pm
 import maya.cmds as cmds
+import maya.api.OpenMaya as om
+import maya.api.OpenMayaUI as omui
+import maya.api.OpenMayaRender as omr
 
 from twa_maya.util.log_to_maya import MayaQtLogger
 import maya.mel as mel
@@ -46,6 +51,13 @@ class HrPlayblast(QtCore.QObject):
         "Low": 26,
     }
 
+    # Stream pipes viewport frames straight into ffmpeg, PNG writes a playblast
+    # image sequence to a temp dir and encodes that
+    CAPTURE_MODES = [
+        "Stream",
+        "PNG",
+    ]
+
     H264_PRESETS = [
         "veryslow",
         "slow",
@@ -111,6 +123,7 @@ class HrPlayblast(QtCore.QObject):
     DEFAULT_H264_QUALITY = "High"
     DEFAULT_H264_PRESET = "fast"
     DEFAULT_IMAGE_QUALITY = 100
+    DEFAULT_CAPTURE_MODE = os.getenv("PLAYBLAST_CAPTURE_MODE", "Stream")
 
     DEFAULT_PADDING = 4
 
@@ -137,6 +150,7 @@ class HrPlayblast(QtCore.QObject):
         self.set_encoding(HrPlayblast.DEFAULT_CONTAINER, HrPlayblast.DEFAULT_ENCODER)
         self.set_h264_settings(HrPlayblast.DEFAULT_H264_QUALITY, HrPlayblast.DEFAULT_H264_PRESET)
         self.set_image_settings(HrPlayblast.DEFAULT_IMAGE_QUALITY)
+        self.set_capture_mode(HrPlayblast.DEFAULT_CAPTURE_MODE)
 
         self.set_visibility(HrPlayblast.DEFAULT_VISIBILITY)
 
@@ -377,6 +391,17 @@ class HrPlayblast(QtCore.QObject):
             "quality": self._image_quality,
         }
 
+    def set_capture_mode(self, capture_mode):
+        if capture_mode not in HrPlayblast.CAPTURE_MODES:
+            self.logger.log_error("Invalid capture mode: {}. Expected one of {}".format(capture_mode, HrPlayblast.CAPTURE_MODES))
+            return
+
+        self._capture_mode = capture_mode
+
+    def get_capture_mode(self):
+
+        return self._capture_mode
+
     def set_output_tempdir(self, output_dir, filename):
 
         if HrPlayblast.USE_LOCAL_TEMPDIR:
@@ -406,6 +431,7 @@ class HrPlayblast(QtCore.QObject):
         if padding <= 0:
             padding = HrPlayblast.DEFAULT_PADDING
 
+        streaming = self.requires_ffmpeg() and self._capture_mode == "Stream"
         if self.requires_ffmpeg():
             output_path = os.path.normpath(os.path.join(output_dir, "{}.{}".format(filename, self._container_format)))
 
@@ -413,6 +439,10 @@ class HrPlayblast(QtCore.QObject):
                 self.logger.log_error("Output file already exists. Eanble overwrite to ignore.")
                 return
 
+            if streaming and self._encoder != "h264":
+                self.logger.log_error("Streaming failed. Unsupported encoder {} for container {}".format(self._encoder, self._container_format))
+                return
+
             playblast_output_dir = self.set_output_tempdir(output_dir, filename)
             playblast_output = os.path.normpath(os.path.join(playblast_output_dir, filename))
             force_overwrite = True
@@ -448,7 +478,10 @@ class HrPlayblast(QtCore.QObject):
             "viewer": viewer,
         }
 
-        self.logger.log_output("Playblast options: {}".format(options))
+        if streaming:
+            self.logger.log_output("Playblast streamed to ffmpeg: {}".format(output_path))
+        else:
+            self.logger.log_output("Playblast options: {}".format(options))
 
         # Store original viewport settings
         orig_camera = self.get_active_camera()
@@ -479,8 +512,12 @@ class HrPlayblast(QtCore.QObject):
             cmds.setAttr(overscan_attr, 1.0)
 
         playblast_failed = False
+        blast_start = time.time()
         try:
-            cmds.playblast(**options)
+            if streaming:
+                self.stream_h264(viewport_model_panel, output_path, start_frame, end_frame, width_height, show_ornaments)
+            else:
+                cmds.playblast(**options)
         except:
             traceback.print_exc()
             self.logger.log_error("Failed to create playblast. See script editor for details.")
@@ -500,7 +537,7 @@ class HrPlayblast(QtCore.QObject):
         if playblast_failed:
             return
 
-        if self.requires_ffmpeg():
+        if self.requires_ffmpeg() and not streaming:
             source_path = "{}/{}.%0{}d.png".format(playblast_output_dir, filename, padding)
 
             if self._encoder == "h264":
@@ -512,6 +549,10 @@ class HrPlayblast(QtCore.QObject):
 
             self.remove_temp_dir(playblast_output_dir)
 
+        if self.requires_ffmpeg():
+            self.logger.log_output("Playblast of {} frames at {}x{} took {:.1f}s ({} capture)".format(
+                end_frame - start_frame + 1, width_height[0], width_height[1], time.time() - blast_start, self._capture_mode))
+
             if show_in_viewer:
                 self.open_in_viewer(output_path)
 
@@ -560,11 +601,17 @@ class HrPlayblast(QtCore.QObject):
         self._ffmpeg_process.readyReadStandardError.connect(self.process_ffmpeg_output)
 
     def execute_ffmpeg_command(self, command):
+        if self.start_ffmpeg_command(command):
+            self.wait_for_ffmpeg()
+
+    def start_ffmpeg_command(self, command):
         self._ffmpeg_process.start(command)
-        if self._ffmpeg_process.waitForStarted():
-            while self._ffmpeg_process.state() != QtCore.QProcess.NotRunning:
-                QtCore.QCoreApplication.processEvents()
-                QtCore.QThread.usleep(10)
+        return self._ffmpeg_process.waitForStarted()
+
+    def wait_for_ffmpeg(self):
+        while self._ffmpeg_process.state() != QtCore.QProcess.NotRunning:
+            QtCore.QCoreApplication.processEvents()
+            QtCore.QThread.usleep(10)
 
     def process_ffmpeg_output(self):
         byte_array_output = self._ffmpeg_process.readAllStandardError()
@@ -579,7 +626,13 @@ class HrPlayblast(QtCore.QObject):
     def encode_h264(self, source_path, output_path, start_frame):
 
         framerate = self.get_frame_rate()
+        input_args = "-framerate {} -i \"{}\"".format(framerate, source_path)
+        ffmpeg_cmd = self.h264_command(input_args, output_path, start_frame, framerate)
+
+        self.logger.log_output(ffmpeg_cmd)
+        self.execute_ffmpeg_command(ffmpeg_cmd)
 
+    def h264_command(self, input_args, output_path, start_frame, framerate, video_filter=None):
         audio_file_path, audio_frame_offset = self.get_audio_attributes()
         if audio_file_path:
             audio_offset = self.get_audio_offset_in_sec(start_frame, audio_frame_offset, framerate)
@@ -588,11 +641,14 @@ class HrPlayblast(QtCore.QObject):
         preset = self._h264_preset
 
         ffmpeg_cmd = self._ffmpeg_path
-        ffmpeg_cmd += " -y -framerate {} -i \"{}\"".format(framerate, source_path)
+        ffmpeg_cmd += " -y {}".format(input_args)
 
         if audio_file_path:
             ffmpeg_cmd += " -ss {} -i \"{}\"".format(audio_offset, audio_file_path)
 
+        if video_filter:
+            ffmpeg_cmd += " -vf \"{}\"".format(video_filter)
+
         ffmpeg_cmd += ' -c:v libx264 -crf:v {} -preset:v {} -profile high -level 4.0 -pix_fmt yuv420p'.format(crf, preset)
 
         if audio_file_path:
@@ -600,8 +656,89 @@ class HrPlayblast(QtCore.QObject):
 
         ffmpeg_cmd += " \"{}\"".format(output_path)
 
-        self.logger.log_output(ffmpeg_cmd)
-        self.execute_ffmpeg_command(ffmpeg_cmd)
+        return ffmpeg_cmd
+
+    def stream_h264(self, model_panel, output_path, start_frame, end_frame, width_height, show_ornaments=True):
+        """
+        Capture every frame from the viewport of model_panel and pipe the raw
+        rgba pixels into ffmpeg. Nothing but the movie is written to disk.
+        """
+        view = omui.M3dView.getM3dViewFromModelPanel(model_panel)
+        model_editor = cmds.modelPanel(model_panel, q=True, modelEditor=True)
+        orig_hud = cmds.modelEditor(model_editor, q=True, hud=True)
+        orig_time = cmds.currentTime(q=True)
+        framerate = self.get_frame_rate()
+        image = om.MImage()
+        size = None
+
+        # Viewport 2.0 draws at the output size instead of the panel size
+        omr.MRenderer.setOutputTargetOverrideSize(width_height[0], width_height[1])
+        cmds.modelEditor(model_editor, e=True, hud=orig_hud and show_ornaments)
+        try:
+            for frame in range(start_frame, end_frame + 1):
+                cmds.currentTime(frame, edit=True, update=True)
+                view.refresh(False, True)
+                view.readColorBuffer(image, True)
+                width, height = image.getSize()
+
+                if size is None:
+                    size = (width, height)
+                    # the color buffer is bottom up and only the panel size on legacy viewports
+                    input_args = "-f rawvideo -pix_fmt rgba -s {}x{} -framerate {} -i -".format(width, height, framerate)
+                    video_filter = "vflip,scale={}:{}".format(width_height[0], width_height[1])
+                    ffmpeg_cmd = self.h264_command(input_args, output_path, start_frame, framerate, video_filter)
+                    self.logger.log_output(ffmpeg_cmd)
+                    if not self.start_ffmpeg_command(ffmpeg_cmd):
+                        raise RuntimeError("Failed to start ffmpeg: {}".format(ffmpeg_cmd))
+                elif (width, height) != size:
+                    raise RuntimeError("Viewport was resized during the playblast")
+
+                self._ffmpeg_process.write(ctypes.string_at(image.pixels(), width * height * 4))
+                # keep a single frame in the pipe, ffmpeg sets the pace
+                while self._ffmpeg_process.bytesToWrite():
+                    if not self._ffmpeg_process.waitForBytesWritten(30000):
+                        raise RuntimeError("ffmpeg stopped reading frames")
+                QtCore.QCoreApplication.processEvents()
+        except:
+            if size:
+                self._ffmpeg_process.kill()
+                self.wait_for_ffmpeg()
+                QtCore.QFile.remove(output_path)
+            raise
+        finally:
+            omr.MRenderer.unsetOutputTargetOverrideSize()
+            cmds.modelEditor(model_editor, e=True, hud=orig_hud)
+            cmds.currentTime(orig_time, edit=True, update=True)
+
+        self._ffmpeg_process.closeWriteChannel()
+        self.wait_for_ffmpeg()
+        if self._ffmpeg_process.exitCode() != 0:
+            raise RuntimeError("ffmpeg failed with exit code {}".format(self._ffmpeg_process.exitCode()))
+
+    def compare_capture_modes(self, output_dir, filename="{scene}_capture_test"):
+        """
+        Blast the current shot with every capture mode at every resolution
+        preset and log the wall clock times. Returns {(preset, mode): seconds}.
+        """
+        orig_resolution = self._resolution_preset or self._width_height
+        orig_capture_mode = self._capture_mode
+        timings = {}
+        try:
+            for preset in sorted(HrPlayblast.RESOLUTION_LOOKUP, key=lambda p: HrPlayblast.RESOLUTION_LOOKUP[p]):
+                self.set_resolution(preset)
+                for capture_mode in HrPlayblast.CAPTURE_MODES:
+                    self.set_capture_mode(capture_mode)
+                    start = time.time()
+                    self.execute(output_dir, "{}_{}_{}".format(filename, preset.replace(" ", ""), capture_mode),
+                                 show_in_viewer=False, overwrite=True)
+                    timings[(preset, capture_mode)] = time.time() - start
+        finally:
+            self.set_resolution(orig_resolution)
+            self.set_capture_mode(orig_capture_mode)
+
+        for preset, capture_mode in sorted(timings):
+            self.logger.log_output("{:<8} {:<7} {:6.1f}s".format(preset, capture_mode, timings[(preset, capture_mode)]))
+        return timings
 
     def get_frame_rate(self):
         rate_str = cmds.currentUnit(q=True, time=True)
@@ -9,7 +9,7 @@ from Qt import (
 import maya.cmds as cmds
 from twa_maya.gui.workspace_control import SampleMayaUI
 from twa_maya.util.log_to_maya import MayaQtLogger
-from Deadline.DeadlineConnect import DeadlineCon
+from deadline_client import deadline
 
 FFMPEG_LOCATION = "Z:\\Projects\\RnD\\ffmpeg\\ffmpeg.exe"
 WORKING_ROOT = "Z:\\Projects\\RnD\\asset_preview"
@@ -18,16 +18,6 @@ POST_JOB_SCRIPT = os.path.join(WORKING_ROOT, "post_job.py")
 PREVIEW_SCENES = os.path.join(WORKING_ROOT, "scenes")
 PREVIEW_RENDERS = os.path.join(WORKING_ROOT, "render")
 
-PULSE_NAME = "dell"
-
-DEADLINE_PORT = 8082
-DEADLINE_LOGIN = "admin"
-DEADLINE_PASSWORD = "123"
-
-deadline_connection = DeadlineCon(PULSE_NAME, DEADLINE_PORT)
-deadline_connection.SetAuthenticationCredentials(
-    DEADLINE_LOGIN, DEADLINE_PASSWORD)
-
 
 class AssetPreviewWindow(SampleMayaUI):
 
@@ -195,7 +185,7 @@ class AssetPreviewWindow(SampleMayaUI):
             cmds.file(save=True, type="mayaAscii")
 
             job_info, plugin_info = self.deadline_info()
-            deadline_connection.Jobs.SubmitJob(job_info, plugin_info)
+            deadline.Jobs.SubmitJob(job_info, plugin_info)
             self.logger.log_output("Successfully submitted job {}!".format(self.scene_name))
         else:
             self.logger.log_error("Scene is not created, or wrong asset name!")
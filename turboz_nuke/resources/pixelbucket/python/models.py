@@ -3,6 +3,9 @@ import mongoengine
 from mongoengine.errors import ValidationError
 from mongoengine.queryset.manager import queryset_manager
 
+# shot info and its backfill (tz_db backfill-shot-info) live with the main NukeJob
+from mongo_documents import comp_shot_info
+
 
 def _file_exists(filename):
     if not os.path.exists(filename):
@@ -22,21 +25,33 @@ class NukeJob(mongoengine.Document):
     nuke_version = mongoengine.StringField(default="11.3")
     render_extension = mongoengine.StringField(default="exr")
     job_id = mongoengine.StringField()
+    shot_number = mongoengine.IntField()
+    episode = mongoengine.StringField()
+    season = mongoengine.StringField()
+
+    meta = {
+            "auto_create_index": False,
+            "index_background": True,
+            "indexes": [
+                "shot_number",
+                ("season", "episode"),
+                "batch_name",
+            ]
+            }
 
     def __str__(self):
         return self.comp_name()
 
+    def clean(self):
+        if self.scene_file:
+            self.shot_number, self.episode, self.season = comp_shot_info(self.scene_file)
+
     def comp_name(self):
         return os.path.splitext(os.path.split(self.scene_file)[-1])[0]
 
     def output_filename(self):
         return "{0}.####.{1}".format(self.comp_name(), self.render_extension)
 
-    def shot_number(self):
-        name_split = self.comp_name().split("shot_")[-1].split("_comp")[0]
-        if name_split.isdigit():
-            return int(name_split)
-
     @queryset_manager
     def by_shotnum(doc_cls, queryset, num):
-        return [j for j in queryset() if j.shot_number() == num]
+        return queryset(shot_number=num)